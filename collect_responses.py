@@ -1,27 +1,6 @@
 import pandas as pd
-import time
-import ollama
 
-# Ollama model wrapper
-class OllamaModel:
-    def __init__(self, model_name="gemma3:4b"):
-        self.model_name = model_name
-
-    def generate_content(self, prompt):
-        try:
-            response = ollama.chat(model=self.model_name, messages=[
-                {
-                    'role': 'user',
-                    'content': prompt,
-                },
-            ])
-            
-            class Response:
-                text = response['message']['content']
-            return Response()
-        except Exception as e:
-            print(f"Ollama Error: {e}")
-            raise e
+from src.ai_handler import AIHandler
 
 def analyze_issue(row, model):
     prompt = f"""
@@ -69,7 +48,7 @@ def main():
         print(f"Loaded {len(df)} queries.")
         
         # Using gemma3:4b as it was found in 'ollama list'
-        model = OllamaModel(model_name="gemma3:4b")
+        model = AIHandler(backend="ollama", model_name="gemma3:4b")
         print(f"Using Ollama model: {model.model_name}")
         
         # Add missing columns if needed
@@ -1,12 +1,14 @@
 import argparse
 import os
 import re
+import sys
+import time
 import pandas as pd
 
 from dotenv import load_dotenv
 load_dotenv()
 from pathlib import Path
-from src import extract, summarize, analyze_thread, consolidate, generate_yaml
+from src import extract, summarize, analyze_thread, consolidate, generate_yaml, http_cache, llm_cache, ai_handler, pipeline, ratelimit
 
 
 def find_existing_results_dir(repo_name, model_name):
@@ -42,6 +44,22 @@ def find_existing_results_dir(repo_name, model_name):
     return matching_dirs[0][0]
 
 
+LLM_STAGES = ("summarize", "thread", "consolidate")
+
+
+def parse_max_tokens(value):
+    """Parse 'summarize=600,thread=1200' into {stage: tokens}."""
+    caps = {}
+    for part in value.split(","):
+        stage, _, tokens = part.partition("=")
+        stage = stage.strip()
+        if stage not in LLM_STAGES or not tokens.strip().isdigit():
+            raise argparse.ArgumentTypeError(
+                f"expected stage=N pairs with stage in {', '.join(LLM_STAGES)}, got '{part}'")
+        caps[stage] = int(tokens)
+    return caps
+
+
 def main():
     parser = argparse.ArgumentParser(description="Automated OpenACR Generator")
     parser.add_argument("--repo", type=str, help="Repo ID (e.g. 'drupal')")
@@ -52,21 +70,70 @@ def main():
                         help="Choose AI backend (default: gemini)")
     parser.add_argument("--model", type=str, 
                         help="Specific model name (e.g., 'llama3', 'gemini-1.5-pro')")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of concurrent LLM requests (default: 1)")
+    parser.add_argument("--llm-rate", type=float,
+                        help="Maximum LLM requests per second (default: 1 for Gemini, unlimited for Ollama)")
+    parser.add_argument("--llm-timeout", type=float, default=300,
+                        help="Seconds to wait for a single LLM response (default: 300)")
+    parser.add_argument("--llm-retries", type=int, default=3,
+                        help="Attempts per LLM call on timeouts, rate limits and server errors (default: 3)")
+    parser.add_argument("--keep-alive", type=str, default=ai_handler.DEFAULT_KEEP_ALIVE,
+                        help="Ollama only: how long the model stays loaded between requests, e.g. '30m', '1h', '-1' (default: 30m)")
+    parser.add_argument("--summary-batch", type=int, default=1,
+                        help="Step 2: summarize this many issues per prompt, falling back to one prompt per issue on parse failures (default: 1)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream LLM responses and stop generating once every field a step parses has been received")
+    parser.add_argument("--max-tokens", type=parse_max_tokens, default={},
+                        help="Per-step generation caps, e.g. 'summarize=600,thread=1200,consolidate=300'")
+    parser.add_argument("--no-llm-cache", action="store_true",
+                        help="Always call the model instead of reusing cached responses for identical prompts")
+    parser.add_argument("--llm-cache-size", type=int, default=200,
+                        help="Maximum size of the LLM response cache in MB (default: 200)")
     parser.add_argument("--tags", type=str,
                         help="Comma-separated list of tags to search for (overrides default accessibility tags)")
     parser.add_argument("--limit", type=int,
                         help="Limit the number of issues to process (useful for testing)")
+    parser.add_argument("--per-tag-limit", type=int, default=50,
+                        help="Maximum new issues taken from each Drupal tag search (default: 50)")
     parser.add_argument("--github-token", type=str,
                         help="GitHub Personal Access Token for higher API rate limits")
     parser.add_argument("--results-dir", type=str,
                         help="Use a specific results directory (overrides auto-generated name)")
+    parser.add_argument("--fetch-workers", type=int, default=4,
+                        help="Number of concurrent issue tracker requests in steps 1 and 3 (default: 4, use 1 for sequential)")
+    parser.add_argument("--fetch-rate", type=float, default=2.0,
+                        help="Maximum requests per second to each issue tracker host (default: 2.0)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Stream issues through summarizing and thread analysis concurrently instead of running steps one after another")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Step 1: only fetch issues updated since the most recent previous run and merge them into its snapshot")
+    parser.add_argument("--thread-token-budget", type=int, default=3000,
+                        help="Step 3: approximate token budget for each issue's comment thread (default: 3000, 0 = no compaction)")
+    parser.add_argument("--consolidate-token-budget", type=int, default=3000,
+                        help="Step 4: approximate token budget of issue notes per consolidation prompt; larger SCs are consolidated in chunks (default: 3000, 0 = never chunk)")
+    parser.add_argument("--http-cache-ttl", type=float, default=12,
+                        help="Hours a cached issue page is reused without revalidation (default: 12, 0 = always revalidate)")
+    parser.add_argument("--http-cache-size", type=int, default=500,
+                        help="Maximum size of the HTTP cache in MB (default: 500)")
+    parser.add_argument("--no-http-cache", action="store_true",
+                        help="Do not read or write the local HTTP cache")
     
     args = parser.parse_args()
+    if args.pipeline and args.step:
+        parser.error("--pipeline runs every step; it cannot be combined with --step")
 
     # Set GitHub token in environment if provided via CLI
     if args.github_token:
         os.environ["GITHUB_TOKEN"] = args.github_token
 
+    http_cache.configure(enabled=not args.no_http_cache,
+                         ttl=args.http_cache_ttl * 3600,
+                         max_mb=args.http_cache_size)
+    llm_cache.configure(enabled=not args.no_llm_cache, max_mb=args.llm_cache_size)
+    # Per-host limiters for steps 1 and 3, set before any step creates one
+    ratelimit.configure(rate=args.fetch_rate, burst=args.fetch_workers)
+
     # Normalize repo input if it's a GitHub URL
     if args.repo and "github.com" in args.repo:
         # Strip protocol and domain
@@ -96,6 +163,11 @@ def main():
         run_folder_name = f"{repo_name}-{model_name}-{today}"
         results_dir = Path("results") / run_folder_name
     
+    # Incremental extraction uses the most recent previous run as its baseline
+    baseline_dir = None
+    if args.incremental and (not args.step or args.step == 1):
+        baseline_dir = find_existing_results_dir(repo_name, model_name)
+
     # Only check for directory overwrite if we're running step 1 or all steps
     if (not args.step or args.step == 1) and results_dir.exists():
         response = input(f"\nDirectory '{results_dir}' already exists. Overwrite? (y/n): ").strip().lower()
@@ -138,30 +210,94 @@ def main():
             print("[WARNING] No model specified and OLLAMA_DEFAULT_MODEL not set in .env. Using package default.")
     ai_config = {
         "backend": args.ai_backend,
-        "model_name": model_name
+        "model_name": model_name,
+        "workers": args.workers,
+        "rate": args.llm_rate,
+        "timeout": args.llm_timeout,
+        "max_retries": args.llm_retries,
+        "keep_alive": args.keep_alive,
+        "stream": args.stream,
+        "max_tokens": args.max_tokens,
+        "summary_batch": args.summary_batch
     }
 
-    if not args.step or args.step == 1:
-        print("\n--- Step 1: Extracting Issues ---")
-        if args.repo:
-            tags_list = args.tags.split(",") if args.tags else None
-            extract.run('drupal', args.repo, results_dir, tags=tags_list, limit=args.limit)
+    timings = []
+    step_started = time.monotonic()
+
+    def step_done(name):
+        nonlocal step_started
+        now = time.monotonic()
+        timings.append((name, now - step_started))
+        step_started = now
+
+    # Load the local model once up front so its cold start isn't billed to
+    # the first issue of step 2 (and the model stays resident between steps)
+    def warm_up_model():
+        print(f"\nLoading Ollama model (keep_alive={args.keep_alive})...")
+        try:
+            load_time = ai_handler.get_handler(ai_config).warm_up()
+            print(f"Model ready after {load_time:.1f}s")
+        except Exception as e:
+            print(f"Warning: could not preload the model ({e}); it will load on the first request.")
+        step_done("Model warm-up (cold start)")
+
+    if args.pipeline:
+        if args.ai_backend == 'ollama':
+            warm_up_model()
+        tags_list = args.tags.split(",") if args.tags else None
+        pipeline.run(args.repo, results_dir, ai_config, tags=tags_list, limit=args.limit,
+                     fetch_workers=args.fetch_workers, baseline_dir=baseline_dir,
+                     per_tag_limit=args.per_tag_limit, token_budget=args.thread_token_budget,
+                     consolidate_token_budget=args.consolidate_token_budget,
+                     extract_issues=bool(args.repo))
+        step_done("Pipeline: steps 1-5")
+    else:
+        if not args.step or args.step == 1:
+            print("\n--- Step 1: Extracting Issues ---")
+            if args.repo:
+                tags_list = args.tags.split(",") if args.tags else None
+                if args.incremental:
+                    if baseline_dir:
+                        print(f"Incremental mode: using {baseline_dir} as baseline")
+                    else:
+                        print("Incremental mode: no previous run found, running a full extraction.")
+                extract.run('drupal', args.repo, results_dir, tags=tags_list, limit=args.limit,
+                            workers=args.fetch_workers, baseline_dir=baseline_dir,
+                            per_tag_limit=args.per_tag_limit)
+            step_done("Step 1: extract")
+
+        if args.ai_backend == 'ollama' and (not args.step or args.step in (2, 3, 4)):
+            warm_up_model()
+
+        if not args.step or args.step == 2:
+            print(f"\n--- Step 2: Summarizing with {args.ai_backend.upper()} ---")
+            summarize.run(results_dir, ai_config, limit=args.limit)
+            step_done("Step 2: summarize")
 
-    if not args.step or args.step == 2:
-        print(f"\n--- Step 2: Summarizing with {args.ai_backend.upper()} ---")
-        summarize.run(results_dir, ai_config, limit=args.limit)
+        if not args.step or args.step == 3:
+            print(f"\n--- Step 3: Analyzing Issue Threads with {args.ai_backend.upper()} ---")
+            analyze_thread.run(results_dir, ai_config, limit=args.limit, fetch_workers=args.fetch_workers,
+                               token_budget=args.thread_token_budget)
+            step_done("Step 3: analyze threads")
 
-    if not args.step or args.step == 3:
-        print(f"\n--- Step 3: Analyzing Issue Threads with {args.ai_backend.upper()} ---")
-        analyze_thread.run(results_dir, ai_config, limit=args.limit)
+        if not args.step or args.step == 4:
+            print(f"\n--- Step 4: Consolidating with {args.ai_backend.upper()} ---")
+            consolidate.run(results_dir, ai_config, token_budget=args.consolidate_token_budget)
+            step_done("Step 4: consolidate")
 
-    if not args.step or args.step == 4:
-        print(f"\n--- Step 4: Consolidating with {args.ai_backend.upper()} ---")
-        consolidate.run(results_dir, ai_config)
+        if not args.step or args.step == 5:
+            print("\n--- Step 5: Generating YAML ---")
+            generate_yaml.run(results_dir)
+            step_done("Step 5: generate YAML")
 
-    if not args.step or args.step == 5:
-        print("\n--- Step 5: Generating YAML ---")
-        generate_yaml.run(results_dir)
+    if timings:
+        print("\n--- Timing ---")
+        for name, seconds in timings:
+            print(f"{name:<28} {seconds:8.1f}s")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        main()
+    except ai_handler.QuotaExhausted as e:
+        print(f"\nStopping: {e}")
+        sys.exit(1)
\ No newline at end of file
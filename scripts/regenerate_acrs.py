@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+regenerate_acrs.py
+
+Re-run step 4 (consolidate) and step 5 (OpenACR YAML) for every run in
+`results/` without prompts. Run directories are discovered the same way as
+`scripts/update_results_index.py`. Each run is re-consolidated with the
+model and generation settings (--max-tokens, timeout, token budget) that
+produced it, as recorded in its manifest; runs without one are only
+regenerated if their directory name (repo-model-date) matches --model.
+Runs of the same model and settings share one client, and every run of a
+backend shares its rate limiter and the LLM cache; several runs are
+processed at once.
+
+A step is skipped when the run's manifest (results/<run>/manifest.json)
+shows it last ran on the same input contents, model and prompt templates and
+its output is untouched since. Runs from before manifests existed fall back
+to comparing file modification times. Within a run that is re-consolidated,
+SCs whose issues are unchanged still reuse their previous assessment;
+--force redoes everything.
+
+Usage:
+  python scripts/regenerate_acrs.py [DIR ...] [--ai-backend ollama --model llama3]
+                                    [--workers N] [--parallel-runs N] [--force] [--dry-run]
+"""
+from __future__ import annotations
+import argparse
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from update_results_index import RESULTS, ROOT, find_all_result_dirs
+
+sys.path.insert(0, str(ROOT))
+from dotenv import load_dotenv  # noqa: E402
+load_dotenv(ROOT / '.env')
+from src import ai_handler, analyze_thread, consolidate, generate_yaml, llm_cache, manifest, summarize, wcag  # noqa: E402
+
+# Code the YAML depends on besides the consolidated CSV (for runs without a manifest)
+YAML_SOURCES = [Path(generate_yaml.__file__), Path(wcag.__file__)]
+
+
+# Steps whose manifest entries record the model a run was made with
+MODEL_STAGES = [consolidate.STAGE, analyze_thread.STAGE, summarize.STAGE]
+
+
+def run_config(run_dir: Path, ai_config: dict, model_tag: str) -> dict | None:
+    """
+    `ai_config` with the backend, model and generation settings (such as
+    --max-tokens) that produced `run_dir`, or None if the run belongs to a
+    different model than the one on the command line.
+    """
+    for stage in MODEL_STAGES:
+        entry = manifest.entry(run_dir, stage)
+        if entry.get('model'):
+            backend, _, model_name = entry['model'].partition(':')
+            config = dict(ai_config, backend=backend, model_name=None if model_name == 'default' else model_name)
+            recorded = {k: v for k, v in (entry.get('settings') or {}).items() if k != 'token_budget'}
+            config.update(recorded)
+            return config
+    # No manifest: run_acr names directories <repo>-<model>-<MM-DD-YYYY>
+    if re.search(rf'-{re.escape(model_tag)}-\d{{2}}-\d{{2}}-\d{{4}}$', run_dir.name):
+        return ai_config
+    return None
+
+
+def run_token_budget(run_dir: Path, default: int | None) -> int:
+    """--consolidate-token-budget if given, else the one the run was consolidated with."""
+    if default is not None:
+        return default
+    recorded = (manifest.entry(run_dir, consolidate.STAGE).get('settings') or {}).get('token_budget')
+    return consolidate.DEFAULT_TOKEN_BUDGET if recorded is None else recorded
+
+
+def mtime(path: Path) -> float:
+    return path.stat().st_mtime if path.exists() else 0.0
+
+
+def stale_steps(run_dir: Path, ai_config: dict, token_budget: int, force: bool = False) -> list[int]:
+    """
+    Steps (4 and/or 5) whose outputs are out of date. Uses the run's manifest
+    entries where they exist, and file modification times where they do not.
+    """
+    summaries = sorted(run_dir.glob('issues_summarized_*.csv'))
+    if not summaries:
+        return []
+    if force:
+        return [4, 5]
+    consolidated = run_dir / consolidate.OUTFILE_NAME
+    if manifest.entry(run_dir, consolidate.STAGE):
+        if not consolidate.up_to_date(run_dir, ai_config, token_budget):
+            return [4, 5]
+    elif mtime(consolidated) < mtime(summaries[-1]):
+        return [4, 5]
+    report = run_dir / generate_yaml.OUTFILE_NAME
+    if manifest.entry(run_dir, generate_yaml.STAGE):
+        if not generate_yaml.up_to_date(run_dir):
+            return [5]
+    elif mtime(report) < max([mtime(consolidated)] + [mtime(p) for p in YAML_SOURCES]):
+        return [5]
+    return []
+
+
+def regenerate(run_dir: Path, steps: list[int], ai_config: dict, token_budget: int, force: bool = False) -> None:
+    print(f'\n--- {run_dir.name}: step(s) {", ".join(map(str, steps))} ---')
+    if 4 in steps:
+        consolidate.run(run_dir, ai_config, token_budget=token_budget, force=force)
+    if 5 in steps:
+        generate_yaml.run(run_dir, force=force)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Regenerate consolidated CSVs and OpenACR YAML for every run')
+    ap.add_argument('dirs', nargs='*', type=Path, help='run directories (default: every directory in results/)')
+    ap.add_argument('--ai-backend', choices=['gemini', 'ollama'], default='gemini')
+    ap.add_argument('--model', help='model for runs without a manifest (default: OLLAMA_DEFAULT_MODEL for Ollama, '
+                                    'package default for Gemini); other runs use the model they were made with')
+    ap.add_argument('--workers', type=int, default=1, help='concurrent LLM requests across all runs (default: 1)')
+    ap.add_argument('--parallel-runs', type=int, default=2, help='runs processed at the same time (default: 2)')
+    ap.add_argument('--llm-rate', type=float, help='maximum LLM requests per second')
+    ap.add_argument('--consolidate-token-budget', type=int,
+                    help='approximate token budget per consolidation prompt (default: the one each run was '
+                         f'consolidated with, else {consolidate.DEFAULT_TOKEN_BUDGET})')
+    ap.add_argument('--no-llm-cache', action='store_true', help='always call the model')
+    ap.add_argument('--force', action='store_true', help='regenerate every run, even if its outputs look current')
+    ap.add_argument('--dry-run', action='store_true', help='only list what would be regenerated')
+    args = ap.parse_args()
+
+    model_name = args.model
+    if args.ai_backend == 'ollama' and not model_name:
+        model_name = os.getenv('OLLAMA_DEFAULT_MODEL')
+    ai_config = {
+        'backend': args.ai_backend,
+        'model_name': model_name,
+        'workers': args.workers,
+        'rate': args.llm_rate,
+    }
+
+    run_dirs = [d.resolve() for d in args.dirs] or find_all_result_dirs()
+    # Same tag run_acr.py puts in directory names
+    model_tag = args.model.replace(':', '') if args.model else 'default'
+    configs = {d: run_config(d, ai_config, model_tag) for d in run_dirs}
+    other_models = [d for d, config in configs.items() if config is None]
+    budgets = {d: run_token_budget(d, args.consolidate_token_budget) for d in run_dirs}
+    plan = [(d, stale_steps(d, configs[d], budgets[d], args.force))
+            for d in run_dirs if configs[d] is not None]
+    todo = [(d, steps) for d, steps in plan if steps]
+    print(f'Found {len(run_dirs)} run directories under {RESULTS.relative_to(ROOT)}; '
+          f'{len(todo)} need regenerating, {len(plan) - len(todo)} are up to date or have no summaries')
+    if other_models:
+        print(f'Skipping {len(other_models)} runs without a manifest that are not named for model '
+              f'"{model_tag}": {", ".join(d.name for d in other_models)}')
+    for d, steps in todo:
+        print(f'  {d.name} ({manifest.model_id(configs[d])}): step(s) {", ".join(map(str, steps))}')
+    if args.dry_run or not todo:
+        return
+
+    llm_cache.configure(enabled=not args.no_llm_cache)
+    # One client per backend/model, shared by all of its runs: get_handler caches them
+    for d, _ in todo:
+        ai_handler.get_handler(configs[d])
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, args.parallel_runs)) as pool:
+        futures = [(d, pool.submit(regenerate, d, steps, configs[d], budgets[d], args.force))
+                   for d, steps in todo]
+        for d, future in futures:
+            try:
+                future.result()
+            except ai_handler.QuotaExhausted as e:
+                for _, other in futures:
+                    other.cancel()
+                print(f'❌ Stopping: {e}')
+                sys.exit(1)
+            except Exception as e:
+                print(f'❌ {d.name}: {e}')
+                failed.append(d.name)
+
+    print(f'\nRegenerated {len(todo) - len(failed)} of {len(todo)} runs')
+    if failed:
+        print('Failed:', ', '.join(failed))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
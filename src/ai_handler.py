@@ -1,54 +1,466 @@
+import datetime
+import hashlib
+import json
 import os
+import random
+import re
+import threading
+import time
+
 import requests
-import google.generativeai as genai
-import json
+from requests.adapters import HTTPAdapter
+
+from src import llm_cache, ratelimit
+
+# Conditionally import genai only when needed
+try:
+    import google.generativeai as genai
+except ImportError:
+    genai = None
+
+DEFAULT_OLLAMA_MODEL = "gemma3:4b"
+DEFAULT_GEMINI_MODEL = "models/gemini-2.0-flash"
+DEFAULT_TIMEOUT = 300  # seconds; local models can be slow on long prompts
+DEFAULT_RETRIES = 3
+DEFAULT_KEEP_ALIVE = "30m"  # how long Ollama keeps the model loaded after each call
+GEMINI_CONTEXT_TTL = 60 * 60  # seconds a Gemini cached system prompt is kept server-side
+
+MAX_THROTTLE_WAIT = 15 * 60  # seconds one call may spend paused on rate limits before giving up
+
+# HTTP statuses worth retrying (rate limits, server errors, overload)...
+_RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+# ...and the subset that means the service wants us to slow down
+_THROTTLED_STATUS = (429, 503)
+# Substrings of error messages worth retrying when there is no status (timeouts, quota)
+_RETRYABLE = ("quota", "unavailable", "deadline", "timed out", "timeout")
+_THROTTLED = ("quota", "resource exhausted", "resource_exhausted", "rate limit", "overloaded", "unavailable")
+# A status code opening the message ("503 Service Unavailable", "500 Server Error: ...")
+# or labelled as one ("status 429", "HTTP 502", "code: 500"), not any number in the text
+_STATUS_TEXT = re.compile(r"(?:^|\b(?:status(?:\s+code)?|http(?:/[\d.]+)?|code)[\s:=]*)([1-5]\d\d)\b", re.IGNORECASE)
+# Gemini puts the suggested delay in the error text rather than a header
+_RETRY_DELAY = re.compile(r"(?:retry in|retry_delay\s*\{\s*seconds:)\s*([\d.]+)", re.IGNORECASE)
+
+
+class QuotaExhausted(RuntimeError):
+    """The backend kept rate limiting us for longer than MAX_THROTTLE_WAIT."""
+
+
+class Response:
+    """Minimal response object; stage code only reads `.text`."""
+
+    def __init__(self, text, cache_key=None):
+        self.text = text
+        self.cache_key = cache_key
+
+
+class LLMMetrics:
+    """Thread-safe per-client call counters, latency and token usage."""
+
+    def __init__(self):
+        self.calls = 0
+        self.cached = 0
+        self.early_stops = 0
+        self.errors = 0
+        self.retries = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency, prompt_tokens=0, completion_tokens=0):
+        with self._lock:
+            self.calls += 1
+            self.latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.prompt_tokens += prompt_tokens or 0
+            self.completion_tokens += completion_tokens or 0
+
+    def count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def summary(self):
+        avg = self.latency / self.calls if self.calls else 0
+        return (f"{self.calls} calls (avg {avg:.1f}s, max {self.max_latency:.1f}s), "
+                f"{self.prompt_tokens} prompt / {self.completion_tokens} completion tokens, "
+                f"{self.cached} cached, {self.early_stops} stopped early, "
+                f"{self.retries} retries, {self.errors} errors")
+
 
 class AIHandler:
-    def __init__(self, backend='gemini', model_name=None):
+    """
+    Shared LLM client for every pipeline stage.
+
+    Ollama is called over a pooled keep-alive HTTP session; Gemini through
+    google-generativeai. Every call goes through the LLM response cache, the
+    per-backend adaptive rate limiter, and retries with jittered exponential
+    backoff, and is recorded in `self.metrics`. Rate-limit and quota errors
+    slow the shared limiter and pause (honoring any suggested retry delay)
+    instead of failing; QuotaExhausted is raised only once a call has waited
+    MAX_THROTTLE_WAIT in total.
+
+    With `stream=True` responses are read incrementally, and a call given
+    `stop_fields` is cancelled as soon as a complete line has been received
+    for every field, instead of waiting for the model to finish its tail.
+    `max_tokens` maps a stage name to a generation cap for that stage.
+
+    A `system` prompt holds the instructions shared by every call of a stage.
+    Ollama gets it as the leading system message, so the runner can reuse the
+    evaluated prefix across issues; for Gemini it is stored once as cached
+    content (falling back to a plain system_instruction where the model or
+    prompt size does not support caching).
+    """
+
+    def __init__(self, backend='gemini', model_name=None, timeout=DEFAULT_TIMEOUT,
+                 max_retries=DEFAULT_RETRIES, options=None, limiter=None, pool_size=4,
+                 keep_alive=DEFAULT_KEEP_ALIVE, stream=False, max_tokens=None):
         self.backend = backend
         self.model_name = model_name
-        
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.stream = stream
+        self.max_tokens = max_tokens or {}
+        self.cold_start = None
+        self.max_retries = max(1, max_retries)
+        self.options = options or {}
+        self.limiter = limiter
+        self.metrics = LLMMetrics()
+        self._system_models = {}
+        self._system_models_lock = threading.Lock()
+
         if backend == 'gemini':
+            if genai is None:
+                raise ImportError("google-generativeai is not installed. Please install it with "
+                                  "'pip install google-generativeai' to use the Gemini backend.")
             api_key = os.getenv("GEMINI_API_KEY")
             if not api_key:
                 raise ValueError("GEMINI_API_KEY not found in environment variables.")
             genai.configure(api_key=api_key)
-            # Default to flash if not specified
-            self.model = genai.GenerativeModel(self.model_name or 'gemini-1.5-flash')
-            
+            # Ensure model name has models/ prefix
+            name = self.model_name or DEFAULT_GEMINI_MODEL
+            self.model_name = name if name.startswith('models/') else f'models/{name}'
+            self.model = genai.GenerativeModel(self.model_name)
+
         elif backend == 'ollama':
-            # Default to llama3 or mistral if not specified
-            self.model_name = self.model_name or 'llama3'
-            self.api_url = "http://localhost:11434/api/generate"
+            self.model_name = self.model_name or DEFAULT_OLLAMA_MODEL
+            host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+            if not host.startswith("http"):
+                host = f"http://{host}"
+            self.base_url = host.rstrip("/")
+            self.api_url = f"{self.base_url}/api/chat"
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(4, pool_size))
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+        else:
+            raise ValueError(f"Unknown AI backend: {backend}")
+
+    def warm_up(self):
+        """
+        Load the model into memory before the first real prompt and pin it
+        with keep_alive so it survives idle gaps between pipeline steps.
+        Returns the load time in seconds (0 for hosted backends).
+        """
+        if self.backend != 'ollama':
+            self.cold_start = 0.0
+            return self.cold_start
+        started = time.monotonic()
+        payload = {"model": self.model_name, "keep_alive": self.keep_alive}
+        response = self.session.post(f"{self.base_url}/api/generate", json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        load_ns = response.json().get("load_duration")
+        self.cold_start = load_ns / 1e9 if load_ns else time.monotonic() - started
+        return self.cold_start
+
+    def generate_content(self, prompt, stage=None, stop_fields=None, system=None):
+        """
+        Generate a response for `prompt`; raises once retries are exhausted.
 
-    def generate(self, prompt):
+        `system` is the static instruction block sent ahead of the prompt.
+
+        `stage` selects the max-token cap configured for that stage.
+        `stop_fields` lists the line prefixes the caller parses (a tuple entry
+        matches any of its alternatives); it only takes effect when streaming.
+        """
+        options = dict(self.options)
+        if self.max_tokens.get(stage):
+            options["num_predict"] = self.max_tokens[stage]
+
+        stop_fields = stop_fields if self.stream else None
+        cache = llm_cache.get_cache()
+        key = None
+        if cache is not None:
+            key = cache.make_key(self.backend, self.model_name, prompt, options, system,
+                                 stream=self.stream, stop_fields=stop_fields)
+            text = cache.get(key)
+            if text is not None:
+                self.metrics.count('cached')
+                return Response(text, key)
+
+        text = self._generate_with_retries(prompt, options, stop_fields, system)
+        if cache is not None and text:
+            cache.put(key, self.backend, self.model_name, text)
+        return Response(text, key)
+
+    def discard(self, response):
+        """
+        Drop a response the caller could not parse from the LLM cache, so a
+        retry asks the model again instead of replaying the same text.
+        """
+        cache = llm_cache.current_cache()
+        if cache is not None and response.cache_key:
+            cache.delete(response.cache_key)
+
+    def generate(self, prompt, system=None):
         """
         Unified generation method.
-        Returns the text response string.
+        Returns the text response string ("" on failure).
         """
-        if self.backend == 'gemini':
+        try:
+            return self.generate_content(prompt, system=system).text
+        except Exception as e:
+            print(f"{self.backend.capitalize()} Error: {e}")
+            return ""
+
+    def _generate_with_retries(self, prompt, options, stop_fields=None, system=None):
+        attempt = 0
+        throttles = 0
+        waited = 0.0
+        while True:
+            if self.limiter:
+                self.limiter.acquire()
+            started = time.monotonic()
             try:
-                response = self.model.generate_content(prompt)
-                return response.text
+                if self.backend == 'gemini':
+                    text, prompt_tokens, completion_tokens = self._call_gemini(prompt, options, stop_fields, system)
+                else:
+                    text, prompt_tokens, completion_tokens = self._call_ollama(prompt, options, stop_fields, system)
             except Exception as e:
-                print(f"Gemini Error: {e}")
-                return ""
-                
-        elif self.backend == 'ollama':
+                if self.limiter:
+                    self.limiter.release(ok=False)
+                message = str(e).lower()
+                summary = str(e).splitlines()[0][:120] if str(e) else type(e).__name__
+
+                status = _status_of(e)
+                if status in _THROTTLED_STATUS or any(marker in message for marker in _THROTTLED):
+                    delay = _retry_after(e)
+                    if delay is None:
+                        delay = min(60, 2 ** throttles) * random.uniform(0.5, 1.5)
+                    throttles += 1
+                    if waited + delay > MAX_THROTTLE_WAIT:
+                        self.metrics.count('errors')
+                        raise QuotaExhausted(f"{self.backend} still rate limited after waiting "
+                                             f"{waited:.0f}s: {summary}") from e
+                    waited += delay
+                    self.metrics.count('retries')
+                    print(f"{self.backend.capitalize()} rate limited ({summary}); "
+                          f"slowing down and pausing {delay:.1f}s...")
+                    if self.limiter:
+                        self.limiter.backoff(delay)
+                    else:
+                        time.sleep(delay)
+                    continue
+
+                attempt += 1
+                retryable = (isinstance(e, requests.ConnectionError) or status in _RETRYABLE_STATUS
+                             or any(marker in message for marker in _RETRYABLE))
+                if not retryable or attempt >= self.max_retries:
+                    self.metrics.count('errors')
+                    raise
+                self.metrics.count('retries')
+                if self.limiter:
+                    # Timeouts usually mean the backend is saturated: shrink the window
+                    self.limiter.backoff(0)
+                delay = min(60, 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                print(f"{self.backend.capitalize()} call failed ({summary}); retrying in {delay:.1f}s...")
+                time.sleep(delay)
+                continue
+
+            if self.limiter:
+                self.limiter.release(ok=True)
+            self.metrics.record(time.monotonic() - started, prompt_tokens, completion_tokens)
+            return text
+
+    def _gemini_model(self, system):
+        """Return a GenerativeModel carrying `system`, creating (or renewing) its cached content."""
+        if not system:
+            return self.model
+        key = hashlib.sha256(system.encode("utf-8")).hexdigest()
+        with self._system_models_lock:
+            model, expires = self._system_models.get(key, (None, 0))
+            if model is None or time.time() >= expires:
+                try:
+                    cached = genai.caching.CachedContent.create(
+                        model=self.model_name,
+                        system_instruction=system,
+                        ttl=datetime.timedelta(seconds=GEMINI_CONTEXT_TTL),
+                    )
+                    model = genai.GenerativeModel.from_cached_content(cached)
+                    # Renew a little before the server drops it
+                    expires = time.time() + GEMINI_CONTEXT_TTL - 300
+                except Exception as e:
+                    print(f"Gemini context caching unavailable ({str(e).splitlines()[0][:120]}); "
+                          f"sending the instructions as a system instruction instead.")
+                    model = genai.GenerativeModel(self.model_name, system_instruction=system)
+                    expires = float("inf")
+                self._system_models[key] = (model, expires)
+            return model
+
+    def _call_gemini(self, prompt, options, stop_fields=None, system=None):
+        model = self._gemini_model(system)
+        kwargs = {"request_options": {"timeout": self.timeout}}
+        if options.get("num_predict"):
+            kwargs["generation_config"] = {"max_output_tokens": options["num_predict"]}
+        if not self.stream:
+            response = model.generate_content(prompt, **kwargs)
+            usage = getattr(response, "usage_metadata", None)
+            return (response.text,
+                    getattr(usage, "prompt_token_count", 0),
+                    getattr(usage, "candidates_token_count", 0))
+
+        stopper = FieldStopper(stop_fields)
+        usage = None
+        for chunk in model.generate_content(prompt, stream=True, **kwargs):
+            usage = getattr(chunk, "usage_metadata", None) or usage
             try:
-                payload = {
-                    "model": self.model_name,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.1  # Keep it factual
-                    }
-                }
-                response = requests.post(self.api_url, json=payload)
-                response.raise_for_status()
-                return response.json().get('response', '')
-            except Exception as e:
-                print(f"Ollama Error (ensure Ollama is running): {e}")
-                return ""
-        
-        return ""
\ No newline at end of file
+                text = chunk.text
+            except ValueError:  # chunk without text parts (e.g. the final one)
+                text = ""
+            if stopper.feed(text):
+                self.metrics.count('early_stops')
+                break
+        return (stopper.text,
+                getattr(usage, "prompt_token_count", 0),
+                getattr(usage, "candidates_token_count", 0))
+
+    def _call_ollama(self, prompt, options, stop_fields=None, system=None):
+        messages = [{"role": "user", "content": prompt}]
+        if system:
+            messages.insert(0, {"role": "system", "content": system})
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "stream": self.stream,
+            "keep_alive": self.keep_alive,
+        }
+        if options:
+            payload["options"] = options
+        if not self.stream:
+            response = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+            return (data.get("message", {}).get("content", ""),
+                    data.get("prompt_eval_count", 0),
+                    data.get("eval_count", 0))
+
+        # Each streamed chunk is roughly one token; closing the connection
+        # makes Ollama abort the generation.
+        stopper = FieldStopper(stop_fields)
+        prompt_tokens = completion_tokens = 0
+        with self.session.post(self.api_url, json=payload, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise RuntimeError(data["error"])
+                completion_tokens += 1
+                stop = stopper.feed(data.get("message", {}).get("content", ""))
+                if data.get("done"):
+                    prompt_tokens = data.get("prompt_eval_count", 0)
+                    completion_tokens = data.get("eval_count", completion_tokens)
+                    break
+                if stop:
+                    self.metrics.count('early_stops')
+                    break
+        return stopper.text, prompt_tokens, completion_tokens
+
+
+class FieldStopper:
+    """
+    Accumulates streamed text and reports when every required field has a
+    complete line, i.e. when the rest of the response would not be parsed.
+    """
+
+    def __init__(self, fields=None):
+        self.pending = list(fields or [])
+        self.text = ""
+        self._checked = 0
+
+    def feed(self, chunk):
+        self.text += chunk or ""
+        if not self.pending:
+            return False
+        end = self.text.rfind("\n")
+        if end < self._checked:
+            return False
+        for line in self.text[self._checked:end].split("\n"):
+            line = line.strip()
+            self.pending = [f for f in self.pending if not line.startswith(f)]
+        self._checked = end + 1
+        return not self.pending
+
+
+def _status_of(error):
+    """HTTP status of a failed call: from the response, Google's `code`, or the message."""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is None and isinstance(getattr(error, "code", None), int):
+        status = error.code
+    if status is None:
+        match = _STATUS_TEXT.search(str(error).strip())
+        status = int(match.group(1)) if match else None
+    return status
+
+
+def _retry_after(error):
+    """Server-suggested delay from a Retry-After header or Gemini's retry_delay, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None and hasattr(headers, "get"):
+        delay = ratelimit.parse_retry_after(headers.get("Retry-After"))
+        if delay is not None:
+            return delay
+    match = _RETRY_DELAY.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+_handlers = {}
+_handlers_lock = threading.Lock()
+
+
+def get_handler(ai_config):
+    """
+    Return the shared AIHandler for the backend/model in `ai_config`.
+
+    Stages run in the same process reuse one client (and so one connection
+    pool and set of metrics) per backend/model and generation settings; the
+    rate limiter is shared by every client of a backend.
+    """
+    backend = ai_config.get('backend', 'gemini')
+    model_name = ai_config.get('model_name')
+    max_tokens = ai_config.get('max_tokens')
+    key = (backend, model_name, tuple(sorted((max_tokens or {}).items())),
+           ai_config.get('timeout'), ai_config.get('stream', False))
+    with _handlers_lock:
+        handler = _handlers.get(key)
+        if handler is None:
+            handler = AIHandler(
+                backend=backend,
+                model_name=model_name,
+                timeout=ai_config.get('timeout') or DEFAULT_TIMEOUT,
+                max_retries=ai_config.get('max_retries') or DEFAULT_RETRIES,
+                limiter=ratelimit.llm_limiter(ai_config),
+                pool_size=ai_config.get('workers') or 1,
+                keep_alive=ai_config.get('keep_alive') or DEFAULT_KEEP_ALIVE,
+                stream=ai_config.get('stream', False),
+                max_tokens=ai_config.get('max_tokens'),
+            )
+            if backend == 'ollama':
+                print(f"Using Ollama backend with model: {handler.model_name}")
+            else:
+                print(f"Using Gemini model: {handler.model_name}")
+            _handlers[key] = handler
+        return handler
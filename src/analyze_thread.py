@@ -1,35 +1,12 @@
 import pandas as pd
 import os
-import sys
+import json
 import time
-import requests
+import queue
+import threading
 from bs4 import BeautifulSoup
-import ollama
 
-# Conditionally import genai only when needed
-try:
-    import google.generativeai as genai
-except ImportError:
-    genai = None
-
-class OllamaModel:
-    def __init__(self, model_name="gemma3:4b"):
-        self.model_name = model_name
-
-    def generate_content(self, prompt):
-        try:
-            response = ollama.chat(model=self.model_name, messages=[
-                {
-                    'role': 'user',
-                    'content': prompt,
-                },
-            ])
-            class Response:
-                text = response['message']['content']
-            return Response()
-        except Exception as e:
-            print(f"Ollama Error: {e}")
-            raise e
+from src import ai_handler, atomic, http_cache, http_client, llm_cache, manifest, thread_compact
 
 def fetch_github_thread(url):
     """Fetch GitHub issue comments using API with pagination."""
@@ -58,8 +35,8 @@ def fetch_github_thread(url):
         # Fetch PRs linked to this issue
         pr_api_url = f"https://api.github.com/repos/{owner}/{repo}/issues/{issue_number}/events"
         try:
-            pr_resp = requests.get(pr_api_url, headers=headers, timeout=30)
-            if pr_resp.status_code == 200:
+            pr_resp = http_client.get(pr_api_url, headers=headers)
+            if pr_resp is not None and pr_resp.status_code == 200:
                 events = pr_resp.json()
                 pr_count = sum(1 for e in events if e.get('event') == 'connected' and e.get('commit_id'))
         except Exception:
@@ -69,8 +46,11 @@ def fetch_github_thread(url):
         
         while True:
             params = {'page': page, 'per_page': per_page}
-            response = requests.get(api_url, headers=headers, params=params, timeout=30)
-            
+            response = http_client.get(api_url, headers=headers, params=params)
+            if response is None:
+                print("Error fetching GitHub comments: no response")
+                break
+
             if response.status_code != 200:
                 print(f"Error fetching GitHub comments: {response.status_code}")
                 if response.status_code == 403:
@@ -124,7 +104,9 @@ def fetch_github_thread(url):
 def scrape_drupal_issue(url):
     """Fetch full Drupal issue page and extract metadata + comments."""
     try:
-        response = requests.get(url, timeout=30)
+        response = http_client.get(url)
+        if response is None:
+            raise RuntimeError("no response")
         response.raise_for_status()
         soup = BeautifulSoup(response.content, 'html.parser')
         
@@ -211,90 +193,25 @@ def scrape_drupal_issue(url):
         print(f"Error scraping issue {url}: {e}")
         return None
 
-def analyze_issue_thread(row, model, url):
-    """Use AI to analyze the full issue thread and generate summaries."""
-    
-    issue_data = None
+def fetch_issue_thread(url):
+    """Fetch metadata and comments for a GitHub or Drupal issue URL."""
     if "github.com" in url:
-        issue_data = fetch_github_thread(url)
-    else:
-        # Scrape the issue page (Drupal)
-        issue_data = scrape_drupal_issue(url)
-        
-    if not issue_data:
-        return "", "", "", "", "", ""
-    
-    # Engagement metrics
-    comments = issue_data.get('comments', [])
-    num_unique_users = len(set(c['author'] for c in comments))
-    num_comments = len(comments)
-    num_patches = issue_data.get('num_patches') or issue_data.get('num_pull_requests') or 0
-    num_screenshots = issue_data.get('num_screenshots', 0)
-    comments_text = "\n".join([
-        (
-            f"#{c['number']} by {c['author']}"
-            + (f" ({c.get('profile_link')})" if c.get('profile_link') else "")
-            + (f" [anchor]({c.get('comment_anchor')})" if c.get('comment_anchor') else "")
-            + f": {c['content'][:300]}"
-        )
-        for c in comments
-    ])
-    engagement_metrics = f"\n\nENGAGEMENT METRICS:\n- Unique users: {num_unique_users}\n- Total comments: {num_comments}\n- Patches/PRs: {num_patches}\n- Screenshots: {num_screenshots}"
+        return fetch_github_thread(url)
+    # Scrape the issue page (Drupal)
+    return scrape_drupal_issue(url)
 
-    # --- Enhancement: Extract patch/MR/test/review activity and next step ---
-    patch_keywords = ['patch', 'diff', 'pull request', 'merge request', 'mr', 'pr']
-    fail_keywords = ['fail', 'failed', 'error', 'test', 'ci', 'pipeline']
-    review_keywords = ['needs review', 'needs work', 'accessibility review', 'awaiting review', 'needs testing', 'needs change record', 'stalled', 'committed', 'merged', 'closed', 'fixed', 'awaiting maintainer']
-    next_step = None
-    latest_patch = None
-    latest_fail = None
-    latest_review = None
-    for c in reversed(comments):
-        text = c['content'].lower()
-        if not latest_patch and any(k in text for k in patch_keywords):
-            latest_patch = c['content'][:200]
-        if not latest_fail and any(k in text for k in fail_keywords):
-            latest_fail = c['content'][:200]
-        if not latest_review and any(k in text for k in review_keywords):
-            latest_review = c['content'][:200]
-        if not next_step:
-            if latest_review:
-                next_step = latest_review
-            elif latest_fail:
-                next_step = latest_fail
-            elif latest_patch:
-                next_step = latest_patch
-
-    next_step_summary = "\nNEXT STEP: "
-    if next_step:
-        next_step_summary += next_step.replace('\n', ' ').strip()[:300]
-    else:
-        next_step_summary += "No clear next step detected from recent activity."
-
-    prompt = f"""
-You are an experienced web accessibility professional reviewing an accessibility
+# Issue-independent part of the thread prompt, sent as the system message
+THREAD_SYSTEM_PROMPT = """You are an experienced web accessibility professional reviewing an accessibility
 issue thread to assess the validity of the reported barrier, the quality of discussion,
 and the current state of resolution based solely on recorded evidence.
 
-Analyze the following accessibility issue thread and provide a structured, factual summary.
-
-ISSUE: {row['Issue Title']}
-REPORTER: {issue_data.get('reporter_info', 'Unknown')}
-FOLLOWERS: {issue_data.get('followers', 'Unknown')}
-RECENT FILES/PATCHES: {', '.join(issue_data.get('recent_files', []))}
-{engagement_metrics}
-{next_step_summary}
-
-COMMENT THREAD:
-{comments_text}
-
-ORIGINAL DESCRIPTION:
-{row['Description']}
+You will be given one issue: its title, reporter, followers, recent files, engagement
+metrics, detected next step, comment thread and original description.
 
 CRITICAL INSTRUCTIONS:
 
 1. NO INVENTION OR INFERENCE  
-Use ONLY information explicitly present in the issue title, description, and comment thread above. Do not infer intent, outcomes, or internal decisions. Do not invent users, events, fixes, or timelines.
+Use ONLY information explicitly present in the issue title, description, and comment thread provided. Do not infer intent, outcomes, or internal decisions. Do not invent users, events, fixes, or timelines.
 
 2. EXPLICIT DATA LIMITS  
 If discussion is limited, state that clearly using phrases such as:
@@ -320,7 +237,7 @@ Use actual comment numbers and usernames. Each timeline entry MUST be on its own
 Do not combine events or summarize multiple comments into one entry.
 
 6. LINK HYGIENE  
-CRITICAL: Do NOT include links to the primary issue being evaluated (the URL provided above). Never reference the current issue itself.
+CRITICAL: Do NOT include links to the primary issue being evaluated (the issue you are given). Never reference the current issue itself.
 DO include:
 - Related issues from the same tracker (if explicitly mentioned in comments)
 - WCAG Success Criteria (w3.org/WAI/WCAG22)
@@ -347,14 +264,14 @@ Once the platform is identified, ALL comment references, user references, and li
 Do NOT mix formats between platforms.
 
 GITHUB FORMATTING RULES (github.com):
-- Comment anchors use the format: https://github.com/{{owner}}/{{repo}}/issues/{{NUMBER}}#issuecomment-{{ID}}
-- User accounts use the format: https://github.com/{{username}}
+- Comment anchors use the format: https://github.com/{owner}/{repo}/issues/{NUMBER}#issuecomment-{ID}
+- User accounts use the format: https://github.com/{username}
 - Timeline entries must reference the GitHub username exactly as shown in the comment thread.
 - When linking to a specific comment, use the GitHub issuecomment anchor, not a generic issue link.
 
 DRUPAL FORMATTING RULES (drupal.org):
-- Comment anchors use the format: https://www.drupal.org/project/{{project}}/issues/{{NUMBER}}#comment-{{ID}}
-- User accounts use the format: https://www.drupal.org/u/{{username}}
+- Comment anchors use the format: https://www.drupal.org/project/{project}/issues/{NUMBER}#comment-{ID}
+- User accounts use the format: https://www.drupal.org/u/{username}
 - Timeline entries must reference the Drupal username exactly as shown in the issue thread.
 - When linking to a specific comment, use the Drupal comment anchor, not the issue page alone.
 
@@ -415,9 +332,89 @@ SENTIMENT: Active collaboration
 TIMELINE: #1 user: did X. #2 user: replied.
 LINKS: - [Reference](https://example.com): Why it matters
 """
+
+THREAD_PROMPT = """Analyze the following accessibility issue thread and provide a structured, factual summary.
+
+ISSUE: {title}
+REPORTER: {reporter}
+FOLLOWERS: {followers}
+RECENT FILES/PATCHES: {recent_files}
+{engagement_metrics}
+{next_step_summary}
+
+COMMENT THREAD:
+{comments_text}
+
+ORIGINAL DESCRIPTION:
+{description}
+"""
+
+def analyze_issue_thread(row, model, url, issue_data=None, token_budget=thread_compact.DEFAULT_TOKEN_BUDGET):
+    """Use AI to analyze the full issue thread and generate summaries."""
+    
+    if issue_data is None:
+        issue_data = fetch_issue_thread(url)
+        
+    if not issue_data:
+        return "", "", "", "", "", ""
+    
+    # Engagement metrics
+    comments = issue_data.get('comments', [])
+    num_unique_users = len(set(c['author'] for c in comments))
+    num_comments = len(comments)
+    num_patches = issue_data.get('num_patches') or issue_data.get('num_pull_requests') or 0
+    num_screenshots = issue_data.get('num_screenshots', 0)
+    # Long threads are compacted to the token budget (0 = send every comment)
+    comments_text, compaction = thread_compact.compact_comments(comments, token_budget)
+    if any(compaction.values()):
+        print(f"Compacted thread {url}: dropped {compaction['bots']} bot, {compaction['duplicates']} duplicate "
+              f"and {compaction['chatter']} status comments, condensed {compaction['folded']}"
+              + (f", cut {compaction['dropped']} older lines to fit" if compaction.get('dropped') else ""))
+    engagement_metrics = f"\n\nENGAGEMENT METRICS:\n- Unique users: {num_unique_users}\n- Total comments: {num_comments}\n- Patches/PRs: {num_patches}\n- Screenshots: {num_screenshots}"
+
+    # --- Enhancement: Extract patch/MR/test/review activity and next step ---
+    patch_keywords = ['patch', 'diff', 'pull request', 'merge request', 'mr', 'pr']
+    fail_keywords = ['fail', 'failed', 'error', 'test', 'ci', 'pipeline']
+    review_keywords = ['needs review', 'needs work', 'accessibility review', 'awaiting review', 'needs testing', 'needs change record', 'stalled', 'committed', 'merged', 'closed', 'fixed', 'awaiting maintainer']
+    next_step = None
+    latest_patch = None
+    latest_fail = None
+    latest_review = None
+    for c in reversed(comments):
+        text = c['content'].lower()
+        if not latest_patch and any(k in text for k in patch_keywords):
+            latest_patch = c['content'][:200]
+        if not latest_fail and any(k in text for k in fail_keywords):
+            latest_fail = c['content'][:200]
+        if not latest_review and any(k in text for k in review_keywords):
+            latest_review = c['content'][:200]
+        if not next_step:
+            if latest_review:
+                next_step = latest_review
+            elif latest_fail:
+                next_step = latest_fail
+            elif latest_patch:
+                next_step = latest_patch
+
+    next_step_summary = "\nNEXT STEP: "
+    if next_step:
+        next_step_summary += next_step.replace('\n', ' ').strip()[:300]
+    else:
+        next_step_summary += "No clear next step detected from recent activity."
+
+    prompt = THREAD_PROMPT.format(
+        title=row['Issue Title'],
+        reporter=issue_data.get('reporter_info', 'Unknown'),
+        followers=issue_data.get('followers', 'Unknown'),
+        recent_files=', '.join(issue_data.get('recent_files', [])),
+        engagement_metrics=engagement_metrics,
+        next_step_summary=next_step_summary,
+        comments_text=comments_text,
+        description=row['Description'],
+    )
     
     try:
-        resp = model.generate_content(prompt)
+        resp = model.generate_content(prompt, stage="thread", system=THREAD_SYSTEM_PROMPT)
         text = resp.text
         
         tldr = ""
@@ -476,99 +473,296 @@ LINKS: - [Reference](https://example.com): Why it matters
             print("⚙️  Debug: model response did not match expected format. Raw output:")
             print(text)
             print("⚙️  End debug output\n")
+            # The row is retried on the next run; don't replay this text from the cache
+            model.discard(resp)
         
         return tldr, problem, sentiment, timeline, links, engagement_metrics
         
+    except ai_handler.QuotaExhausted:
+        raise
     except Exception as e:
         error_str = str(e)
-        # Check for critical quota/rate limit errors
-        if "429" in error_str or "quota" in error_str.lower():
-            print(f"\nCRITICAL ERROR: API Quota Exceeded or Rate Limit Hit.")
-            print(f"Details: {error_str.splitlines()[0]}")
-            print("Exiting gracefully to prevent further errors.")
-            sys.exit(1)
-
         # Clean up verbose error messages
         error_msg = error_str.split('\n')[0]
         if len(error_msg) > 200: error_msg = error_msg[:200] + "..."
         print(f"Error analyzing thread: {error_msg}")
         return "", "", "", "", "", ""
 
-def run(results_dir, ai_config, limit=None):
-    """Analyze issue threads for all issues."""
-    files = sorted(results_dir.glob("issues_summarized_*.csv"))
-    if not files:
-        print("No summarized issues found to analyze.")
-        return
-    
-    infile = files[-1]
-    print(f"Reading from {infile}")
-    df = pd.read_csv(infile)
-    
-    # Apply limit if specified
-    if limit:
-        print(f"Limiting to first {limit} issues (out of {len(df)} total)")
-        df = df.head(limit)
+THREAD_COLUMNS = ['thread_tldr', 'thread_problem', 'thread_sentiment', 'thread_timeline', 'thread_links']
+JOURNAL_NAME = "issues_thread_analyzed.journal.jsonl"
+
+# Manifest entry for this step, and the per-row hash of what each analysis was made from
+STAGE = "thread"
+HASH_COLUMN = "thread_hash"
+
+def prompt_hash(ai_config, token_budget=thread_compact.DEFAULT_TOKEN_BUDGET):
+    max_tokens = (ai_config.get('max_tokens') or {}).get('thread')
+    return manifest.text_hash(THREAD_SYSTEM_PROMPT, THREAD_PROMPT, token_budget, max_tokens)
+
+def thread_activity(row):
+    """
+    What changes when a thread gets a new comment: its reply count, or the
+    "Updated" time for rows extracted before counts were recorded. (Drupal's
+    "Updated" is derived from a relative age, so it shifts on every extraction.)
+    """
+    count = row.get('Comments')
+    try:
+        return int(count)
+    except (TypeError, ValueError):
+        return row.get('Updated')
+
+def row_hash(row, model_id, prompt):
+    return manifest.text_hash(model_id, prompt, row.get('Issue URL'), thread_activity(row), row.get('Status'),
+                              row.get('Issue Title'), row.get('Description'))
+
+def read_journal(path):
+    """Return {Issue ID: record} from an append-only journal, ignoring a torn last line."""
+    records = {}
+    if not path.exists():
+        return records
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # partially written line from an interrupted run
+            records[str(record.get('Issue ID'))] = record
+    return records
+
+def append_journal(handle, record):
+    """Append one analyzed row and force it to disk."""
+    handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+    handle.flush()
+    os.fsync(handle.fileno())
+
+def journal_record(df, idx):
+    """The journal record for row `idx`, or None if it has no analysis."""
+    values = {col: df.at[idx, col] for col in THREAD_COLUMNS}
+    values = {col: str(v) if pd.notna(v) else "" for col, v in values.items()}
+    if not any(v.strip() for v in values.values()):
+        return None
+    record = {'Issue ID': str(df.at[idx, 'Issue ID']), 'Issue URL': df.at[idx, 'Issue URL'],
+              HASH_COLUMN: df.at[idx, HASH_COLUMN]}
+    record.update(values)
+    return record
+
+def compact_journal(path, df):
+    """
+    Rewrite the journal to the analyses that are still live: one record per
+    analyzed row of `df`, plus untouched records for issues outside it (such
+    as rows beyond --limit). Stale and superseded records are dropped.
+    """
+    ids = set(df['Issue ID'].astype(str))
+    records = [r for issue_id, r in read_journal(path).items() if issue_id not in ids]
+    records += [r for r in (journal_record(df, idx) for idx in df.index) if r]
+    with atomic.writer(path) as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def run(results_dir, ai_config, limit=None, fetch_workers=4, token_budget=thread_compact.DEFAULT_TOKEN_BUDGET,
+        df=None, incoming=None):
+    """
+    Analyze issue threads for all issues.
+
+    Normally reads the latest summarized CSV. In pipeline mode (see
+    src.pipeline) `df` is the frame being summarized and `incoming` a queue
+    of (idx, row) pairs, ended by None, delivered as each summary completes.
+    """
+    model_id = manifest.model_id(ai_config)
+    prompt = prompt_hash(ai_config, token_budget)
+    if df is None:
+        files = sorted(results_dir.glob("issues_summarized_*.csv"))
+        if not files:
+            print("No summarized issues found to analyze.")
+            return
+
+        infile = files[-1]
+        if manifest.is_current(results_dir, STAGE, manifest.fingerprint(infile, model_id, prompt, limit=limit)):
+            print(f"✅ Summaries, model and prompt unchanged since {manifest.entry(results_dir, STAGE)['output']} "
+                  f"was written; no threads to analyze")
+            return
+        print(f"Reading from {infile}")
+        df = pd.read_csv(infile)
+
+        # Apply limit if specified
+        if limit:
+            print(f"Limiting to first {limit} issues (out of {len(df)} total)")
+            df = df.head(limit)
+    else:
+        df = df.copy()
     
     # Ensure output columns exist
-    for col in ['thread_tldr', 'thread_problem', 'thread_sentiment', 'thread_timeline', 'thread_links']:
+    for col in THREAD_COLUMNS:
         if col not in df.columns:
             df[col] = ""
+        df[col] = df[col].astype(object)
+    df[HASH_COLUMN] = [row_hash(row, model_id, prompt) for _, row in df.iterrows()]
     
-    backend = ai_config.get('backend', 'gemini')
-    model_name = ai_config.get('model_name')
-    
-    if backend == 'ollama':
-        target_model = model_name if model_name else "gemma3:4b"
-        print(f"Using Ollama backend with model: {target_model}")
-        model = OllamaModel(model_name=target_model)
-    else:
-        print("Using Gemini backend")
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        # Ensure model name has models/ prefix
-        if model_name:
-            target_model = model_name if model_name.startswith('models/') else f'models/{model_name}'
-        else:
-            target_model = 'models/gemini-2.0-flash'
-        print(f"Using Gemini model: {target_model}")
-        model = genai.GenerativeModel(target_model)
+    model = ai_handler.get_handler(ai_config)
     
     # Determine output file
     timestamp = pd.Timestamp.now().strftime('%Y%m%d')
     outfile = results_dir / f"issues_thread_analyzed_{timestamp}.csv"
+
+    # Every analyzed row is appended to a journal as soon as it completes;
+    # resuming replays it, and the CSV is compacted from it at the end.
+    journal_path = results_dir / JOURNAL_NAME
+    journal = read_journal(journal_path)
+    if journal:
+        print(f"Resuming from {journal_path}: {len(journal)} issues already analyzed")
+        stale = 0
+        for idx, row in df.iterrows():
+            record = journal.get(str(row['Issue ID']))
+            if not record:
+                continue
+            # Records from before row hashes were journaled are trusted as they are
+            if record.get(HASH_COLUMN) not in (None, df.at[idx, HASH_COLUMN]):
+                stale += 1
+                continue
+            for col in THREAD_COLUMNS:
+                df.at[idx, col] = record.get(col, "")
+        if stale:
+            print(f"{stale} issues changed (or were analyzed with another model or prompt); analyzing them again")
     
-    print(f"Analyzing threads for {len(df)} issues...")
-    
-    for idx, row in df.iterrows():
+    def admit(idx, row):
+        """Return the issue URL to analyze, or None if the row is done or unusable."""
         # Skip if already analyzed (check if thread_timeline has actual content, not just empty string)
-        if pd.notna(row.get('thread_timeline')) and row.get('thread_timeline', '').strip():
+        if pd.notna(df.at[idx, 'thread_timeline']) and str(df.at[idx, 'thread_timeline']).strip():
             print(f"Skipping {idx+1}/{len(df)}: Already analyzed")
-            continue
-        
+            return None
+
         issue_url = row.get('Issue URL', '')
         if not issue_url or ('drupal.org' not in issue_url and 'github.com' not in issue_url):
             print(f"Skipping {idx+1}/{len(df)}: No valid Drupal.org or GitHub URL")
-            continue
-        
-        # Extract issue number from URL
-        issue_num = ''
-        if '/issues/' in issue_url:
-            issue_num = issue_url.split('/issues/')[-1].split('/')[0].split('#')[0]
-            issue_num = f"#{issue_num} "
-        
-            print(f"Processing {issue_num}{idx+1}/{len(df)}: {row['Issue Title'][:50]}...")
+            return None
+        return issue_url
+
+    fetch_workers = max(1, fetch_workers)
+    llm_workers = max(1, ai_config.get('workers') or 1)
+    if incoming is None:
+        print(f"Analyzing threads for {len(df)} issues "
+              f"({fetch_workers} fetch workers, {llm_workers} LLM workers)...")
+    else:
+        print(f"Analyzing threads as summaries arrive "
+              f"({fetch_workers} fetch workers, {llm_workers} LLM workers)...")
+
+    # Two-stage pipeline: fetch workers download threads into a bounded
+    # queue (blocking when the LLM stage falls behind) and LLM workers
+    # consume it, so network I/O overlaps with model latency.
+    todo = queue.Queue(maxsize=2 * fetch_workers)
+    fetched = queue.Queue(maxsize=2 * llm_workers)
+    results = queue.Queue()
+    timings = {'fetch': 0.0, 'llm': 0.0, 'llm_idle': 0.0}
+    timings_lock = threading.Lock()
+
+    def add_time(stage, started):
+        with timings_lock:
+            timings[stage] += time.monotonic() - started
+
+    def feed():
+        # Rows come from the summarized CSV, or stream in from summarize;
+        # skipped rows still go to the results queue so their summary is kept.
+        source = df.iterrows() if incoming is None else iter(incoming.get, None)
+        for idx, row in source:
+            issue_url = admit(idx, row)
+            if issue_url:
+                todo.put((idx, row, issue_url))
+            else:
+                results.put((idx, row, None, None, None))
+        for _ in range(fetch_workers):
+            todo.put(None)
+
+    def fetch_worker():
+        while True:
+            item = todo.get()
+            if item is None:
+                return
+            idx, row, issue_url = item
+            started = time.monotonic()
+            try:
+                issue_data = fetch_issue_thread(issue_url)
+            except Exception as e:
+                print(f"Error fetching thread {issue_url}: {e}")
+                issue_data = None
+            add_time('fetch', started)
+            fetched.put((idx, row, issue_url, issue_data))
+
+    def llm_worker():
+        while True:
+            started = time.monotonic()
+            item = fetched.get()
+            add_time('llm_idle', started)
+            if item is None:
+                return
+            idx, row, issue_url, issue_data = item
+            try:
+                if not issue_data:
+                    results.put((idx, row, issue_url, ("", "", "", "", "", ""), None))
+                    continue
+                # Extract issue number from URL
+                issue_num = ''
+                if '/issues/' in issue_url:
+                    issue_num = issue_url.split('/issues/')[-1].split('/')[0].split('#')[0]
+                    issue_num = f"#{issue_num} "
+                print(f"Processing {issue_num}{idx+1}/{len(df)}: {row['Issue Title'][:50]}...")
+                started = time.monotonic()
+                outcome = analyze_issue_thread(row, model, issue_url, issue_data=issue_data,
+                                               token_budget=token_budget)
+                add_time('llm', started)
+                results.put((idx, row, issue_url, outcome, None))
+            except BaseException as e:
+                # Includes QuotaExhausted; re-raised by the main thread
+                results.put((idx, row, issue_url, None, e))
+
+    fetch_threads = [threading.Thread(target=fetch_worker, daemon=True) for _ in range(fetch_workers)]
+    llm_threads = [threading.Thread(target=llm_worker, daemon=True) for _ in range(llm_workers)]
+
+    feeder = threading.Thread(target=feed, daemon=True)
+
+    def close_fetch_stage():
+        for t in fetch_threads:
+            t.join()
+        for _ in llm_threads:
+            fetched.put(None)
+        for t in llm_threads:
+            t.join()
+        feeder.join()
+        results.put(None)
+
+    wall_started = time.monotonic()
+    for t in [feeder] + fetch_threads + llm_threads:
+        t.start()
+    threading.Thread(target=close_fetch_stage, daemon=True).start()
+
+    with open(journal_path, 'a', encoding='utf-8') as journal_handle:
+        for idx, row, issue_url, outcome, error in iter(results.get, None):
+            if incoming is not None:
+                # Keep the summary columns that arrived with the row
+                for col, value in row.items():
+                    if col not in THREAD_COLUMNS:
+                        df.at[idx, col] = value
+            if issue_url is None:
+                continue
+            if isinstance(error, ai_handler.QuotaExhausted):
+                df.to_csv(outfile, index=False)
+                print(f"Rate limits did not lift; saved progress to {outfile}. Re-run step 3 to resume.")
+                raise error
+            if error is not None:
+                print(f"❌ Error analyzing issue {issue_url}: {error}\n")
+                continue
+
+            tldr, problem, sentiment, timeline, links, engagement_metrics = outcome
 
-        print(f"🔗 URL: {issue_url}")
-        
-        try:
-            tldr, problem, sentiment, timeline, links, engagement_metrics = analyze_issue_thread(row, model, issue_url)
-            
             df.at[idx, 'thread_tldr'] = tldr
             df.at[idx, 'thread_problem'] = problem
             df.at[idx, 'thread_sentiment'] = sentiment
             df.at[idx, 'thread_timeline'] = timeline
             df.at[idx, 'thread_links'] = links
-            
+            record = journal_record(df, idx)
+            if record:
+                append_journal(journal_handle, record)
+
+            print(f"🔗 URL: {issue_url}")
             # Only display if we got actual content
             if tldr or problem or sentiment or timeline or links:
                 print(f"\n{'='*80}")
@@ -582,18 +776,26 @@ def run(results_dir, ai_config, limit=None):
                 print(f"{'='*80}\n")
             else:
                 print("⚠️  No analysis generated (issue may have no comments or scraping failed)\n")
-            
-            # Save progress incrementally
-            if (idx + 1) % 10 == 0:
-                df.to_csv(outfile, index=False)
-                print(f"  Checkpoint: Saved {idx + 1} analyzed issues")
-            
-            # Rate limiting
-            time.sleep(2)
-            
-        except Exception as e:
-            print(f"❌ Error analyzing issue: {e}\n")
-            continue
-    
+
+    # Compact the journal (already applied to df) into the CSV, and the
+    # journal itself down to the rows that are still live
     df.to_csv(outfile, index=False)
+    compact_journal(journal_path, df)
+    # Recorded against the summaries this run covered (in pipeline mode they
+    # are complete by the time the last row arrives)
+    files = sorted(results_dir.glob("issues_summarized_*.csv"))
+    if files:
+        manifest.record(results_dir, STAGE, manifest.fingerprint(files[-1], model_id, prompt, limit=limit), outfile,
+                        settings=manifest.settings(ai_config, token_budget=token_budget))
     print(f"Thread analysis complete. Saved to {outfile}")
+    print(f"Timing: wall {time.monotonic() - wall_started:.1f}s | "
+          f"fetch {timings['fetch']:.1f}s over {fetch_workers} workers | "
+          f"LLM {timings['llm']:.1f}s over {llm_workers} workers "
+          f"(idle {timings['llm_idle']:.1f}s waiting for threads)")
+    cache = http_cache.current_cache()
+    if cache:
+        print(f"HTTP cache: {cache.stats()}")
+    print(f"LLM metrics: {model.metrics.summary()}")
+    cache = llm_cache.current_cache()
+    if cache:
+        print(f"LLM cache: {cache.stats()}")
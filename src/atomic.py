@@ -0,0 +1,24 @@
+import os
+import secrets
+from contextlib import contextmanager
+from pathlib import Path
+
+
+@contextmanager
+def writer(path, encoding="utf-8"):
+    """
+    Open `path` for writing through a temporary file in the same directory
+    that replaces it only once the block succeeds, so readers never see a
+    partial file. The temporary file is created with a plain open(), so it
+    gets the usual permissions (0666 minus the umask) without touching the
+    process umask, which other threads may rely on.
+    """
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{secrets.token_hex(4)}.tmp")
+    try:
+        with open(tmp, "x", encoding=encoding) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
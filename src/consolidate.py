@@ -1,35 +1,36 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
-import os
-import ollama
-
-# Conditionally import genai only when needed
-try:
-    import google.generativeai as genai
-except ImportError:
-    genai = None
-
-class OllamaModel:
-    def __init__(self, model_name="gemma3:4b"):
-        self.model_name = model_name
-
-    def generate_content(self, prompt):
-        try:
-            response = ollama.chat(model=self.model_name, messages=[
-                {
-                    'role': 'user',
-                    'content': prompt,
-                },
-            ])
-            class Response:
-                text = response['message']['content']
-            return Response()
-        except Exception as e:
-            print(f"Ollama Error: {e}")
-            raise e
-
-def consolidate_sc(sc, group, model):
-    issues_text = "\n".join([f"- {r['acr_note']} (Status: {r['Status']})" for _, r in group.iterrows()])
-    prompt = f"""
+
+from src import ai_handler, llm_cache, manifest, thread_compact, wcag
+
+OUTFILE_NAME = "wcag-acr-consolidated.csv"
+# Manifest entry; its "items" hold each SC's input hash for the row in OUTFILE_NAME
+STAGE = "consolidate"
+
+# Approximate tokens of issue notes sent in one consolidation prompt
+DEFAULT_TOKEN_BUDGET = 3000
+
+# Columns searched for SC mentions, in priority order
+REFERENCE_COLUMNS = ["Issue Description", "acr_note", "dev_note", "thread_journey", "paste_summary"]
+
+# A bare number right after one of these is a software version, not an SC
+VERSION_WORDS = frozenset(["version", "versions", "release", "v", "drupal", "core", "php", "jquery",
+                           "ckeditor", "node", "symfony", "composer", "branch", "tag"])
+
+# One pass finds every SC mention. `prefix` is set for "WCAG 1.4.3" / "SC 1.4.3"
+# style references; `context` is the word before a bare number. The number
+# must stand alone, so "10.3.1" or "1.4.3.2" never match.
+WCAG_REFERENCE = re.compile(
+    r"(?:(?P<prefix>\b(?:WCAG(?:\s*2\.[012])?|SC|success\s+criterion)[\s:]*(?:SC[\s:]*)?)"
+    r"|(?P<context>\b[A-Za-z]+\.?\s+))?"
+    r"(?<![\w.])(?P<sc>" + wcag.SC_PATTERN + r")"
+    r"(?![\w]|\.\d)",
+    re.IGNORECASE,
+)
+
+CONSOLIDATE_PROMPT = """
 You are preparing formal OpenACR / VPAT documentation for a vendor accessibility
 attestation that may be submitted as part of a government procurement process. You are the accessibility expert for the product. 
 
@@ -37,8 +38,8 @@ This content must be factual, conservative, and suitable for legal and complianc
 
 WCAG SUCCESS CRITERION: {sc}
 
-RELATED OPEN ACCESSIBILITY ISSUES:
-{issues_text}
+{heading}
+{evidence}
 
 INSTRUCTIONS:
 
@@ -82,8 +83,69 @@ LEVEL: <supports | partially-supports | does-not-support | not-applicable>
 REMARKS: <single paragraph under 500 characters>
 ISSUES: <ID1>, <ID2>, <ID3>
     """
+
+ISSUES_HEADING = "RELATED OPEN ACCESSIBILITY ISSUES:"
+CHUNK_HEADING = "RELATED OPEN ACCESSIBILITY ISSUES (one part of a larger set):"
+PARTIALS_HEADING = ("PARTIAL ASSESSMENTS (each covers a subset of the open issues; the overall level\n"
+                    "should be no better than the most severe well-supported partial level):")
+
+def chunk_lines(lines, token_budget, min_lines=1):
+    """Split `lines` into consecutive chunks of at most ~token_budget tokens each."""
+    chunks, current, used = [], [], 0
+    for line in lines:
+        cost = thread_compact.estimate_tokens(line)
+        if len(current) >= min_lines and used + cost > token_budget:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(line)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+def consolidate_sc(sc, group, model, token_budget=DEFAULT_TOKEN_BUDGET, workers=1):
+    """
+    Assess one SC from its issues' ACR notes.
+
+    Groups whose notes exceed `token_budget` are consolidated map-reduce
+    style: each chunk gets its own LEVEL/REMARKS (in parallel), and those
+    partial assessments are then merged by a final call.
+    """
+    lines = [f"- {r['acr_note']} (Status: {r['Status']})" for _, r in group.iterrows()]
+    chunks = chunk_lines(lines, token_budget) if token_budget else [lines]
+    if len(chunks) <= 1:
+        return assess(sc, ISSUES_HEADING, "\n".join(lines), model)
+
+    print(f"SC {sc}: {len(lines)} issues split into {len(chunks)} chunks")
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        partials = list(pool.map(lambda chunk: assess(sc, CHUNK_HEADING, "\n".join(chunk), model), chunks))
+    return reduce_assessments(sc, partials, [len(chunk) for chunk in chunks], model, token_budget, workers)
+
+def reduce_assessments(sc, partials, counts, model, token_budget, workers=1):
+    """Merge partial (level, remarks) assessments into one, in more rounds if they do not fit."""
+    # A verdict from only some of the issues would look complete and be reused
+    # on later runs; leave the SC not-evaluated so the next run retries it
+    if any(level == "not-evaluated" for level, _ in partials):
+        return "not-evaluated", "Error during consolidation"
+    lines = [f"- {level} ({count} issues): {remarks}" for (level, remarks), count in zip(partials, counts)]
+    # At least two partials per chunk, so every round shrinks the list
+    chunks = chunk_lines(lines, token_budget, min_lines=2)
+    if len(chunks) > 1:
+        chunk_counts = []
+        start = 0
+        for chunk in chunks:
+            chunk_counts.append(sum(counts[start:start + len(chunk)]))
+            start += len(chunk)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            merged = list(pool.map(lambda chunk: assess(sc, PARTIALS_HEADING, "\n".join(chunk), model), chunks))
+        return reduce_assessments(sc, merged, chunk_counts, model, token_budget, workers)
+    return assess(sc, PARTIALS_HEADING, "\n".join(lines), model)
+
+def assess(sc, heading, evidence, model):
+    """One LLM call: LEVEL and REMARKS for `sc` from the evidence under `heading`."""
+    prompt = CONSOLIDATE_PROMPT.format(sc=sc, heading=heading, evidence=evidence)
     try:
-        resp = model.generate_content(prompt)
+        resp = model.generate_content(prompt, stage="consolidate", stop_fields=("LEVEL:", "REMARKS:"))
         text = resp.text
         
         level = "partially-supports" # Default fallback
@@ -98,108 +160,176 @@ ISSUES: <ID1>, <ID2>, <ID3>
             remarks = text
             
         return level, remarks
+    except ai_handler.QuotaExhausted:
+        raise
     except Exception as e:
         print(f"Error consolidating SC {sc}: {e}")
         return "not-evaluated", "Error during consolidation"
 
-def run(results_dir, ai_config):
+def find_wcag_references(df, columns=REFERENCE_COLUMNS):
+    """
+    Return a frame of (sc, column) indexed like `df` for the rows that mention
+    a WCAG SC from the catalog. Explicit "WCAG"/"SC" references win over bare numbers,
+    then earlier columns over later ones, then the first mention in a column.
+    """
+    found = []
+    for order, col in enumerate(columns):
+        if col not in df.columns:
+            continue
+        matches = df[col].dropna().astype(str).str.extractall(WCAG_REFERENCE)
+        if matches.empty:
+            continue
+        context = matches['context'].fillna("").str.strip().str.rstrip(".").str.lower()
+        matches = matches[matches['prefix'].notna() | ~context.isin(VERSION_WORDS)]
+        found.append(pd.DataFrame({
+            'sc': matches['sc'],
+            'column': col,
+            'rank': matches['prefix'].isna().astype(int) * len(columns) + order,
+        }))
+    if not found:
+        return pd.DataFrame(columns=['sc', 'column'])
+    found = pd.concat(found).reset_index(level='match')
+    # Stable sort keeps the first mention first within each (row, rank)
+    found = found.sort_values(['rank', 'match'], kind='stable')
+    return found[~found.index.duplicated()][['sc', 'column']].sort_index()
+
+def reference_sources(group):
+    """"Issue ID (column)" for each issue in `group` that was reassigned from a mention in that column."""
+    matched = group[group['wcag_source'] != ""]
+    return "; ".join(f"{issue_id} ({column})" for issue_id, column in zip(matched['Issue ID'], matched['wcag_source']))
+
+def prompt_hash(ai_config, token_budget=DEFAULT_TOKEN_BUDGET):
+    """Hash of the prompt templates and of the settings that change what the model is asked."""
+    max_tokens = (ai_config.get('max_tokens') or {}).get('consolidate')
+    return manifest.text_hash(CONSOLIDATE_PROMPT, ISSUES_HEADING, CHUNK_HEADING, PARTIALS_HEADING,
+                              token_budget, max_tokens)
+
+def stage_fingerprint(results_dir, ai_config, token_budget=DEFAULT_TOKEN_BUDGET):
+    """Manifest fingerprint of this step for the latest summaries, or None if there are none."""
+    files = sorted(results_dir.glob("issues_summarized_*.csv"))
+    if not files:
+        return None
+    return manifest.fingerprint(files[-1], manifest.model_id(ai_config), prompt_hash(ai_config, token_budget))
+
+def up_to_date(results_dir, ai_config, token_budget=DEFAULT_TOKEN_BUDGET):
+    fp = stage_fingerprint(results_dir, ai_config, token_budget)
+    return fp is not None and manifest.is_current(results_dir, STAGE, fp)
+
+def group_hash(sc, group, model_id, prompt):
+    """Order-independent hash of everything consolidate_sc sees for one SC."""
+    notes = sorted([str(r['acr_note']), str(r['Status'])] for _, r in group.iterrows())
+    return manifest.text_hash(sc, model_id, prompt, notes)
+
+def load_previous(results_dir):
+    """Return ({SC: consolidated row}, {SC: input hash}) from an earlier run, if any."""
+    outfile = results_dir / OUTFILE_NAME
+    hashes = manifest.entry(results_dir, STAGE).get("items") or {}
+    if not outfile.exists() or not hashes:
+        return {}, {}
+    try:
+        rows = {str(r["WCAG SC"]): r for r in pd.read_csv(outfile).to_dict("records")}
+    except (ValueError, OSError, KeyError) as e:
+        print(f"Ignoring previous consolidation ({e})")
+        return {}, {}
+    return rows, hashes
+
+def run(results_dir, ai_config, token_budget=DEFAULT_TOKEN_BUDGET, force=False):
+    """Consolidate the latest summaries per SC. `force` re-assesses every SC."""
     files = sorted(results_dir.glob("issues_summarized_*.csv"))
     if not files:
         print("No summarized issues found to consolidate.")
         return
     
     infile = files[-1]
+    fp = stage_fingerprint(results_dir, ai_config, token_budget)
+    if not force and manifest.is_current(results_dir, STAGE, fp):
+        print(f"✅ Summaries, model and prompt unchanged since {results_dir / OUTFILE_NAME} was written; nothing to consolidate")
+        return
+
     print(f"Reading from {infile}")
     df = pd.read_csv(infile)
     
-    backend = ai_config.get('backend', 'gemini')
-    model_name = ai_config.get('model_name')
-    
-    if backend == 'ollama':
-        target_model = model_name if model_name else "gemma3:4b"
-        print(f"Using Ollama backend with model: {target_model}")
-        model = OllamaModel(model_name=target_model)
-    else:
-        print("Using Gemini backend")
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        # Ensure model name has models/ prefix
-        if model_name:
-            target_model = model_name if model_name.startswith('models/') else f'models/{model_name}'
-        else:
-            target_model = 'models/gemini-2.0-flash'
-        print(f"Using Gemini model: {target_model}")
-        model = genai.GenerativeModel(target_model)
+    model = ai_handler.get_handler(ai_config)
     
     consolidated = []
     
-    # Pre-process: Try to extract WCAG SC from "General" issues based on content
-    def extract_wcag_from_content(row):
-        """Look for WCAG SC patterns in issue content."""
-        import re
-        # Check all text fields for WCAG patterns
-        text_fields = [
-            str(row.get('Issue Description', '')),
-            str(row.get('acr_note', '')),
-            str(row.get('dev_note', '')),
-            str(row.get('thread_journey', '')),
-            str(row.get('paste_summary', ''))
-        ]
-        full_text = ' '.join(text_fields)
-        
-        # Look for patterns like "WCAG 4.1.2", "4.1.2", "SC 4.1.2"
-        patterns = [
-            r'WCAG\s*(\d+\.\d+\.\d+)',
-            r'SC\s*(\d+\.\d+\.\d+)',
-            r'\b(\d+\.\d+\.\d+)\b'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, full_text)
-            if match:
-                return match.group(1)
-        return None
-    
-    # Reassign "General" issues that have WCAG mentions
-    general_mask = ~df['ai_wcag'].str.match(r'\d+\.\d+\.\d+', na=False)
-    reassigned_count = 0
-    
-    for idx in df[general_mask].index:
-        extracted_sc = extract_wcag_from_content(df.loc[idx])
-        if extracted_sc:
-            df.at[idx, 'ai_wcag'] = extracted_sc
-            reassigned_count += 1
-    
-    if reassigned_count > 0:
-        print(f"📝 Reassigned {reassigned_count} 'General' issues to specific WCAG SC based on content mentions")
-    
+    # SC-like values the catalog does not know are consolidated as General
+    unknown = df.loc[df['ai_wcag'].astype(str).str.match(r'\d+\.\d+\.\d+')
+                     & ~df['ai_wcag'].isin(wcag.CRITERIA.keys()), 'ai_wcag']
+    if not unknown.empty:
+        print(f"⚠️ {len(unknown)} issues name SCs that are not in WCAG 2.0-2.2 "
+              f"({', '.join(sorted(unknown.unique()))}); treating them as General")
+
+    # Reassign "General" issues that mention a specific SC
+    general_mask = ~df['ai_wcag'].isin(wcag.CRITERIA.keys())
+    references = find_wcag_references(df[general_mask])
+    df['wcag_source'] = ""
+    if not references.empty:
+        df['ai_wcag'] = df['ai_wcag'].astype(object)
+        df.loc[references.index, 'ai_wcag'] = references['sc']
+        df.loc[references.index, 'wcag_source'] = references['column']
+        sources = ", ".join(f"{col}: {n}" for col, n in references['column'].value_counts().items())
+        print(f"📝 Reassigned {len(references)} 'General' issues to specific WCAG SC based on content mentions ({sources}); "
+              f"see the Reference Sources column of {OUTFILE_NAME}")
+
     # Handle valid SCs (including newly reassigned ones)
-    valid_sc_df = df[df['ai_wcag'].str.match(r'\d+\.\d+\.\d+', na=False)]
+    valid_sc_df = df[df['ai_wcag'].isin(wcag.CRITERIA.keys())]
     print(f"Found {len(valid_sc_df)} issues with valid WCAG SCs.")
     
-    for sc, group in valid_sc_df.groupby('ai_wcag'):
-        print(f"Consolidating SC {sc} ({len(group)} issues)...")
-        level, remarks = consolidate_sc(sc, group, model)
-        consolidated.append({
-            "WCAG SC": sc,
-            "ACR Assessment": level,
-            "ACR Summary": remarks,
-            "Issue Count": len(group)
-        })
+    # (row label, label given to the model, issues) in output order
+    groups = [(sc, sc, group) for sc, group in valid_sc_df.groupby('ai_wcag')]
 
     # Handle unmapped/general issues
-    unmapped_df = df[~df['ai_wcag'].str.match(r'\d+\.\d+\.\d+', na=False)]
+    unmapped_df = df[~df['ai_wcag'].isin(wcag.CRITERIA.keys())]
     if not unmapped_df.empty:
         print(f"Found {len(unmapped_df)} unmapped/general accessibility issues.")
         # We group them all under a special "General" category
-        level, remarks = consolidate_sc("General Accessibility (Unmapped)", unmapped_df, model)
-        consolidated.append({
-            "WCAG SC": "General",
-            "ACR Assessment": level,
-            "ACR Summary": remarks,
-            "Issue Count": len(unmapped_df)
-        })
-        
+        groups.append(("General", "General Accessibility (Unmapped)", unmapped_df))
+
+    # SCs whose notes/statuses are unchanged since the last run keep their row
+    previous_rows, previous_hashes = load_previous(results_dir) if not force else ({}, {})
+    hashes = {}
+    todo = []
+    for key, label, group in groups:
+        hashes[key] = group_hash(label, group, fp["model"], fp["prompt_hash"])
+        previous = previous_rows.get(key)
+        if (previous and previous_hashes.get(key) == hashes[key]
+                and previous.get("ACR Assessment") != "not-evaluated"):
+            continue
+        todo.append((key, label, group))
+    if len(todo) < len(groups):
+        print(f"Reusing {len(groups) - len(todo)} unchanged SCs from the previous consolidation")
+
+    def consolidate_group(label, group):
+        print(f"Consolidating SC {label} ({len(group)} issues)...")
+        return consolidate_sc(label, group, model, token_budget=token_budget, workers=workers)
+
+    workers = max(1, ai_config.get('workers') or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {key: pool.submit(consolidate_group, label, group) for key, label, group in todo}
+        # Collected in SC order, so the output matches a serial run
+        for key, label, group in groups:
+            if key in futures:
+                level, remarks = futures[key].result()
+            else:
+                level = previous_rows[key]["ACR Assessment"]
+                remarks = previous_rows[key]["ACR Summary"]
+            consolidated.append({
+                "WCAG SC": key,
+                "ACR Assessment": level,
+                "ACR Summary": remarks,
+                "Issue Count": len(group),
+                # Not model output, so recomputed even for reused SCs
+                "Reference Sources": reference_sources(group),
+            })
+
     out_df = pd.DataFrame(consolidated)
-    outfile = results_dir / "wcag-acr-consolidated.csv"
+    outfile = results_dir / OUTFILE_NAME
     out_df.to_csv(outfile, index=False)
+    manifest.record(results_dir, STAGE, fp, outfile, items=hashes,
+                    settings=manifest.settings(ai_config, token_budget=token_budget))
     print(f"Saved consolidated report to {outfile}")
+    print(f"LLM metrics: {model.metrics.summary()}")
+    cache = llm_cache.current_cache()
+    if cache:
+        print(f"LLM cache: {cache.stats()}")
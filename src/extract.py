@@ -1,11 +1,13 @@
-import requests
 from bs4 import BeautifulSoup
 import pandas as pd
 from datetime import datetime
-import time
 import re
 import os
-from functools import lru_cache
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from src import http_cache, http_client, ratelimit, wcag
 
 def sanitize_drupal_tag_text(field_item):
     """Extract only the visible tag label, excluding tooltip/helper text."""
@@ -53,43 +55,124 @@ def normalize_taxonomy_values(values):
     return "|".join(normalized)
 
 
-@lru_cache(maxsize=512)
+# Drupal issue statuses included in a normal (non-incremental) search
+DRUPAL_ACTIVE_STATUSES = {
+    1: "Active",
+    8: "Needs review",
+    13: "Needs work",
+    14: "Reviewed & tested by the community",
+    16: "Postponed (maintainer needs more info)",
+}
+
+_AGE_UNITS = {
+    "sec": 1, "min": 60, "hour": 3600, "day": 86400,
+    "week": 7 * 86400, "month": 30 * 86400, "year": 365 * 86400,
+}
+
+
+def parse_drupal_age(text, now=None):
+    """
+    Convert a Drupal relative age such as "2 days 3 hours" into an approximate
+    UTC timestamp string. Returns "Unknown" when the text can't be parsed.
+    """
+    matches = re.findall(r'(\d+)\s*(sec|min|hour|day|week|month|year)', str(text).lower())
+    if not matches:
+        return "Unknown"
+    seconds = sum(int(n) * _AGE_UNITS[unit] for n, unit in matches)
+    now = now or pd.Timestamp.now(tz='UTC')
+    return (now - pd.Timedelta(seconds=seconds)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def is_active_issue(status):
+    """True for open GitHub issues and Drupal issues in one of the active statuses."""
+    return status == "open" or status in DRUPAL_ACTIVE_STATUSES.values()
+
+
+def parse_drupal_issue_taxonomies(content):
+    """Parse the "Issue tags" field out of a Drupal issue detail page."""
+    soup = BeautifulSoup(content, 'html.parser')
+    tags = []
+    seen = set()
+
+    for field in soup.select('div.field'):
+        label = field.find(class_='field-label')
+        if not label:
+            continue
+        label_text = label.get_text(strip=True).lower()
+        if 'issue tags' not in label_text:
+            continue
+        for item in field.select('.field-item'):
+            tag_text = sanitize_drupal_tag_text(item)
+            if not tag_text:
+                continue
+            sanitized = tag_text.replace('|', '/').strip()
+            key = sanitized.lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            tags.append(sanitized)
+
+    return tags
+
+
+def _fetch_drupal_issue_taxonomies(issue_url):
+    response = http_client.get(issue_url)
+    if response is None:
+        raise RuntimeError("no response")
+    response.raise_for_status()
+    return parse_drupal_issue_taxonomies(response.content)
+
+
 def fetch_drupal_issue_taxonomies(issue_url):
     """Fetch Drupal issue tags (taxonomies) from the issue detail page."""
     if not issue_url:
         return []
 
     try:
-        response = requests.get(issue_url, timeout=30)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        tags = []
-        seen = set()
-
-        for field in soup.select('div.field'):
-            label = field.find(class_='field-label')
-            if not label:
-                continue
-            label_text = label.get_text(strip=True).lower()
-            if 'issue tags' not in label_text:
-                continue
-            for item in field.select('.field-item'):
-                tag_text = sanitize_drupal_tag_text(item)
-                if not tag_text:
-                    continue
-                sanitized = tag_text.replace('|', '/').strip()
-                key = sanitized.lower()
-                if key in seen:
-                    continue
-                seen.add(key)
-                tags.append(sanitized)
-
-        return tags
+        return _fetch_drupal_issue_taxonomies(issue_url)
     except Exception as exc:
         print(f"Warning: unable to fetch taxonomies for {issue_url}: {exc}")
         return []
 
-def extract_github_issues(repo_full_name, tags=None, limit=50):
+
+def enrich_drupal_taxonomies(all_issues, workers=4):
+    """
+    Fetch issue tags for every collected Drupal issue in one batched stage.
+
+    Runs after all tag searches so each issue page is requested once, however
+    many search tags matched it. Each issue's "Taxonomies" value (the search
+    tag that found it) is kept and merged after the fetched tags.
+    """
+    urls = list(dict.fromkeys(issue["Issue URL"] for issue in all_issues.values() if issue.get("Issue URL")))
+    if not urls:
+        return
+
+    print(f"Fetching taxonomies for {len(urls)} issues ({max(1, workers)} workers)...")
+    fetched = {}
+    failures = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(_fetch_drupal_issue_taxonomies, url): url for url in urls}
+        for done, future in enumerate(as_completed(futures), start=1):
+            url = futures[future]
+            try:
+                fetched[url] = future.result()
+            except Exception as exc:
+                failures.append(url)
+                print(f"Warning: unable to fetch taxonomies for {url}: {exc}")
+            if done % 25 == 0 or done == len(urls):
+                print(f"  Taxonomies: {done}/{len(urls)} fetched ({len(failures)} failed)")
+
+    for issue in all_issues.values():
+        issue_tags = list(fetched.get(issue["Issue URL"], []))
+        for search_tag in filter(None, issue.get("Taxonomies", "").split("|")):
+            if not any(existing.lower() == search_tag.lower() for existing in issue_tags):
+                issue_tags.append(search_tag)
+        issue["Taxonomies"] = normalize_taxonomy_values(issue_tags)
+
+    if failures:
+        print(f"Could not fetch taxonomies for {len(failures)} issues; kept their search tag only.")
+
+def extract_github_issues(repo_full_name, tags=None, limit=None, since=None):
     print(f"Extracting GitHub issues for: {repo_full_name}")
     # repo_full_name should be "owner/repo"
     
@@ -113,8 +196,8 @@ def extract_github_issues(repo_full_name, tags=None, limit=50):
         print("Discovering accessibility labels...")
         labels_url = f"https://api.github.com/repos/{repo_full_name}/labels"
         try:
-            l_resp = requests.get(labels_url, headers=headers, params={"per_page": 100})
-            if l_resp.status_code == 200:
+            l_resp = http_client.get(labels_url, headers=headers, params={"per_page": 100})
+            if l_resp is not None and l_resp.status_code == 200:
                 repo_labels = [l['name'] for l in l_resp.json()]
                 # Find labels containing keywords
                 discovered = [l for l in repo_labels if any(k in l.lower() for k in ["accessibility", "a11y", "wcag"])]
@@ -126,74 +209,191 @@ def extract_github_issues(repo_full_name, tags=None, limit=50):
         except Exception as e:
             print(f"Warning: Could not auto-discover labels: {e}")
 
-    for label in labels:
-        page = 1
-        while True:
-            url = f"https://api.github.com/repos/{repo_full_name}/issues"
-            params = {
-                "labels": label,
-                "state": "open",
-                "per_page": 100, # Max per page
-                "page": page
-            }
-            
-            try:
-                response = requests.get(url, headers=headers, params=params)
-                if response.status_code != 200:
-                    print(f"Error fetching GitHub issues: {response.status_code} {response.text}")
-                    if response.status_code == 403 and "rate limit" in response.text.lower():
-                        print("Tip: Use --github-token <token> to increase your API rate limit.")
-                    break
-                
-                issues = response.json()
-                if not issues:
-                    break
-                
-                for issue in issues:
-                    # Skip pull requests if we only want issues
-                    if "pull_request" in issue:
-                        continue
-                        
-                    issue_id = str(issue["number"])
-                    if issue_id not in all_issues:
-                        issue_labels = [
-                            lbl.get("name", "").strip()
-                            for lbl in issue.get("labels", [])
-                            if lbl.get("name")
-                        ]
-                        all_issues[issue_id] = {
-                            "Issue ID": issue_id,
-                            "Issue Title": issue["title"],
-                            "Description": issue["body"] if issue["body"] else "",
-                            "Issue URL": issue["html_url"],
-                            "Project": repo_full_name,
-                            "Status": issue["state"],
-                            "Priority": "Unknown", # GitHub doesn't have standard priority field
-                            "Component": "Unknown",
-                            "Version": "Unknown",
-                            "Created": issue["created_at"],
-                            "wcag_sc": "Unknown", # We'd need to parse labels or body for this
-                            "Taxonomies": normalize_taxonomy_values(issue_labels)
-                        }
-                
-                if len(all_issues) >= limit:
+    # One OR-combined search instead of a paged /issues loop per label, so an
+    # issue carrying several labels is downloaded once.
+    label_filter = ",".join('"{}"'.format(label.replace('"', '')) for label in labels)
+    query = f"repo:{repo_full_name} is:issue label:{label_filter}"
+    if since:
+        # Incremental: include closed issues so they can be dropped from the snapshot
+        query += f" updated:>={since}"
+    else:
+        query += " is:open"
+
+    search_url = "https://api.github.com/search/issues"
+    per_page = min(100, limit) if limit else 100
+    page = 1
+    while True:
+        params = {
+            "q": query,
+            "sort": "updated",
+            "order": "desc",
+            "per_page": per_page, # Max 100
+            "page": page
+        }
+
+        try:
+            response = http_client.get(search_url, headers=headers, params=params)
+            if response is None:
+                print("Error fetching GitHub issues: no response")
+                break
+            if response.status_code != 200:
+                print(f"Error fetching GitHub issues: {response.status_code} {response.text}")
+                if response.status_code == 403 and "rate limit" in response.text.lower():
+                    print("Tip: Use --github-token <token> to increase your API rate limit.")
+                break
+
+            issues = response.json().get("items", [])
+            if not issues:
+                break
+
+            for issue in issues:
+                # Skip pull requests if we only want issues
+                if "pull_request" in issue:
+                    continue
+
+                issue_id = str(issue["number"])
+                if limit and len(all_issues) >= limit:
                     break
-                page += 1
-            except Exception as e:
-                print(f"Exception fetching GitHub issues: {e}")
+                if issue_id not in all_issues:
+                    issue_labels = [
+                        lbl.get("name", "").strip()
+                        for lbl in issue.get("labels", [])
+                        if lbl.get("name")
+                    ]
+                    all_issues[issue_id] = {
+                        "Issue ID": issue_id,
+                        "Issue Title": issue["title"],
+                        "Description": issue["body"] if issue["body"] else "",
+                        "Issue URL": issue["html_url"],
+                        "Project": repo_full_name,
+                        "Status": issue["state"],
+                        "Priority": "Unknown", # GitHub doesn't have standard priority field
+                        "Component": "Unknown",
+                        "Version": "Unknown",
+                        "Created": issue["created_at"],
+                        "Updated": issue.get("updated_at", "Unknown"),
+                        "Comments": issue.get("comments", "Unknown"),
+                        "wcag_sc": "Unknown", # We'd need to parse labels or body for this
+                        "Taxonomies": normalize_taxonomy_values(issue_labels)
+                    }
+
+            # The search API stops at 1000 results
+            if (limit and len(all_issues) >= limit) or len(issues) < per_page or page * per_page >= 1000:
                 break
-        
-        if len(all_issues) >= limit:
+            page += 1
+        except Exception as e:
+            print(f"Exception fetching GitHub issues: {e}")
             break
-            
+
+    quota = http_client.quota_status("api.github.com")
+    if quota:
+        remaining = ", ".join(f"{name} {q['remaining']}/{q['limit']}" for name, q in sorted(quota.items()))
+        print(f"GitHub API quota remaining: {remaining}")
+
     print(f"Total unique GitHub issues found: {len(all_issues)}")
     return pd.DataFrame(list(all_issues.values()))
 
-def extract_drupal_issues(project_id, tags=None, limit=50):
+def drupal_tag_to_wcag(tag):
+    """Map a search tag such as "wcag111" to its SC ("1.1.1"), "General" or "Unknown"."""
+    sc = wcag.from_tag(tag)
+    if sc:
+        return sc
+    if tag in ["accessibility", "a11y", "wcag"]:
+        return "General"
+    return "Unknown"
+
+
+def merge_drupal_search_page(all_issues, content, tag, project_id, since=None, now=None,
+                             limit=None, per_tag_limit=None):
+    """
+    Parse one Drupal issue search page and merge its rows into `all_issues`.
+
+    With `since`, the page is expected to be sorted by last update (newest
+    first) and parsing stops at the first row not updated after `since`.
+    At most `per_tag_limit` new issues are taken from this page, and none
+    once `all_issues` holds `limit` issues.
+    """
+    soup = BeautifulSoup(content, 'html.parser')
+
+    table = soup.find('table', class_='project-issue')
+    if not table:
+        return
+
+    rows = table.find('tbody').find_all('tr')
+
+    # Parse WCAG SC from tag if possible
+    # tag is like "wcag111" -> "1.1.1"
+    current_wcag = drupal_tag_to_wcag(tag)
+    added = 0
+
+    for row in rows:
+        if per_tag_limit and added >= per_tag_limit:
+            break
+        try:
+            title_link = row.find('td', class_='views-field-title').find('a')
+            title = title_link.text.strip()
+            link = 'https://www.drupal.org' + title_link['href']
+            issue_id = link.split('/')[-1]
+
+            # Safe extraction of fields
+            def get_text(class_name):
+                el = row.find('td', class_=class_name)
+                return el.text.strip() if el else "Unknown"
+
+            updated = parse_drupal_age(get_text('views-field-last-comment-timestamp'), now=now)
+            if since and updated != "Unknown" and updated <= since:
+                break
+
+            if issue_id in all_issues:
+                # Update WCAG if we found a more specific one
+                if all_issues[issue_id]["wcag_sc"] in ["Unknown", "General"] and current_wcag not in ["Unknown", "General"]:
+                     all_issues[issue_id]["wcag_sc"] = current_wcag
+                continue
+
+            if limit and len(all_issues) >= limit:
+                continue
+
+            status = get_text('views-field-field-issue-status')
+            priority = get_text('views-field-field-issue-priority')
+            component = get_text('views-field-field-issue-component')
+            version = get_text('views-field-field-issue-version')
+            created = get_text('views-field-created')
+            replies = re.match(r'\d+', get_text('views-field-comment-count'))
+
+            description = title
+
+            # Full issue tags are fetched later by enrich_drupal_taxonomies();
+            # until then record the search tag that found this issue.
+            normalized_tag = tag.replace('|', '/').strip() if tag else ""
+
+            all_issues[issue_id] = {
+                "Issue ID": issue_id,
+                "Issue Title": title,
+                "Description": description,
+                "Issue URL": link,
+                "Project": project_id,
+                "Status": status,
+                "Priority": priority,
+                "Component": component,
+                "Version": version,
+                "Created": created,
+                "Updated": updated,
+                "Comments": int(replies.group()) if replies else "Unknown",
+                "wcag_sc": current_wcag,
+                "Taxonomies": normalize_taxonomy_values(normalized_tag)
+            }
+            added += 1
+
+        except Exception as e:
+            continue
+
+
+def extract_drupal_issues(project_id, tags=None, limit=None, workers=4, since=None, per_tag_limit=50):
     print(f"Extracting issues for project: {project_id}")
     base_url = f"https://www.drupal.org/project/issues/search/{project_id}"
     
-    # List of tags to search for. We'll fetch them sequentially to ensure coverage.
+    # List of tags to search for. Each tag is a separate request; these run on a
+    # small worker pool (see `workers`) throttled by the per-host rate limiter.
     # Note: Drupal.org search is inclusive, so searching for multiple tags at once might be restrictive (AND logic)
     # or permissive (OR logic) depending on the field. For tags, it's often AND.
     # So we will make separate requests and merge them.
@@ -205,176 +405,152 @@ def extract_drupal_issues(project_id, tags=None, limit=50):
         # Base tags
         tags_to_search = ["accessibility", "a11y", "wcag"]
         
-        # Generate specific SC tags (e.g., wcag111, wcag131, wcag412)
-        # We include a broad range to cover A, AA, AAA for WCAG 2.0, 2.1, 2.2
-        sc_list = [
-            # Perceivable
-            "111", "121", "122", "123", "124", "125", "126", "127", "128", "129",
-            "131", "132", "133", "134", "135", "136",
-            "141", "142", "143", "144", "145", "146", "147", "148", "149", "1410", "1411", "1412", "1413",
-            # Operable
-            "211", "212", "213", "214",
-            "221", "222", "223", "224", "225", "226",
-            "231", "232", "233",
-            "241", "242", "243", "244", "245", "246", "247", "248", "249", "2410", "2411", "2412", "2413",
-            "251", "252", "253", "254", "255", "256", "257", "258",
-            # Understandable
-            "311", "312", "313", "314", "315", "316",
-            "321", "322", "323", "324", "325", "326",
-            "331", "332", "333", "334", "335", "336", "337", "338", "339",
-            # Robust
-            "411", "412", "413"
-        ]
-        
-        tags_to_search.extend([f"wcag{sc}" for sc in sc_list])
+        # Specific SC tags (e.g., wcag111, wcag131, wcag412) for every
+        # criterion in WCAG 2.0, 2.1 and 2.2
+        tags_to_search.extend(wcag.TAGS)
+
+    if limit:
+        # A limited run stops after the first tags, so it would miss the later
+        # SC tags that upgrade "General" issues. Searching SC tags first (in
+        # their usual order) gives each collected issue the SC a full crawl would.
+        tags_to_search.sort(key=lambda t: drupal_tag_to_wcag(t) in ["Unknown", "General"])
     
     all_issues = {} # Use dict with Issue ID as key to deduplicate
     error_count = 0
+    error_lock = threading.Lock()
+    stop = threading.Event()
+    enough = threading.Event()
+    limiter = ratelimit.limiter_for(http_client.host_of(base_url))
 
     def register_error():
         nonlocal error_count
-        error_count += 1
-        if error_count == 2:
+        with error_lock:
+            error_count += 1
+            count = error_count
+        if count == 2:
             wait = 5
-            print(f"Encountered {error_count} errors. Pausing for {wait} seconds before continuing...")
-            time.sleep(wait)
-        elif error_count == 5:
+            print(f"Encountered {count} errors. Pausing for {wait} seconds before continuing...")
+            limiter.pause(wait)
+        elif count == 5:
             wait = 30
-            print(f"Encountered {error_count} errors. Pausing for {wait} seconds before continuing...")
-            time.sleep(wait)
-        elif error_count >= 10:
-            print("Encountered 10 errors. Stopping extraction early to avoid spamming the server.")
+            print(f"Encountered {count} errors. Pausing for {wait} seconds before continuing...")
+            limiter.pause(wait)
+        elif count >= 10:
+            if not stop.is_set():
+                print("Encountered 10 errors. Stopping extraction early to avoid spamming the server.")
+            stop.set()
             return True
         return False
 
-    for tag in tags_to_search:
+    def fetch_tag(tag):
+        if stop.is_set() or enough.is_set():
+            return None
         params = {
             "issue_tags": tag,
-            "status[]": [1, 8, 13, 14, 16], # Active statuses
-            "limit": limit
+            "status[]": list(DRUPAL_ACTIVE_STATUSES),
+            "limit": per_tag_limit or 50
         }
-        
-        # Retry logic
-        max_retries = 3
-        backoff = 5
-        response = None
-        
-        for attempt in range(max_retries):
-            try:
-                print(f"Fetching issues with tag '{tag}' (Attempt {attempt+1})...")
-                response = requests.get(base_url, params=params)
-                
-                if response.status_code == 429:
-                    wait = backoff * (attempt + 1)
-                    print(f"Rate limited (429). Waiting {wait} seconds...")
-                    if register_error():
-                        return pd.DataFrame(list(all_issues.values()))
-                    time.sleep(wait)
-                    continue
-                    
-                response.raise_for_status()
-                break # Success
-            except Exception as e:
-                print(f"Error fetching tag '{tag}': {e}")
-                if register_error():
-                    return pd.DataFrame(list(all_issues.values()))
-                time.sleep(1)
-        
-        if not response or response.status_code != 200:
-            print(f"Failed to fetch tag '{tag}' after retries.")
-            if register_error():
-                return pd.DataFrame(list(all_issues.values()))
-            continue
+        if since:
+            # Incremental: newest first, any status, so closed issues are seen too
+            params.pop("status[]")
+            params.update({"status": "All", "order": "last_comment_timestamp", "sort": "desc"})
+        print(f"Fetching issues with tag '{tag}'...")
+        # Incremental runs must see the live ordering, so skip TTL cache reuse
+        return http_client.get(base_url, params=params, on_error=register_error, use_cache=not since)
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-            
-        table = soup.find('table', class_='project-issue')
-        if not table:
-            continue
+    now = pd.Timestamp.now(tz='UTC')
+    cutoff = None
+    if since:
+        # Drupal only shows coarse relative ages, so allow an hour of overlap
+        cutoff = (pd.Timestamp(since) - pd.Timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%SZ')
 
-        rows = table.find('tbody').find_all('tr')
-        
-        # Parse WCAG SC from tag if possible
-        # tag is like "wcag111" -> "1.1.1"
-        current_wcag = "Unknown"
-        if tag.startswith("wcag") and tag[4:].isdigit():
-            nums = tag[4:]
-            if len(nums) >= 3:
-                current_wcag = f"{nums[0]}.{nums[1]}.{nums[2:]}"
-        elif tag in ["accessibility", "a11y", "wcag"]:
-            current_wcag = "General"
-        
-        for row in rows:
-            try:
-                title_link = row.find('td', class_='views-field-title').find('a')
-                title = title_link.text.strip()
-                link = 'https://www.drupal.org' + title_link['href']
-                issue_id = link.split('/')[-1]
-                
-                if issue_id in all_issues:
-                    # Update WCAG if we found a more specific one
-                    if all_issues[issue_id]["wcag_sc"] in ["Unknown", "General"] and current_wcag not in ["Unknown", "General"]:
-                         all_issues[issue_id]["wcag_sc"] = current_wcag
-                    continue 
-
-                # Safe extraction of fields
-                def get_text(class_name):
-                    el = row.find('td', class_=class_name)
-                    return el.text.strip() if el else "Unknown"
-
-                status = get_text('views-field-field-issue-status')
-                priority = get_text('views-field-field-issue-priority')
-                component = get_text('views-field-field-issue-component')
-                version = get_text('views-field-field-issue-version')
-                created = get_text('views-field-created')
-                
-                description = title 
-
-                issue_tags = fetch_drupal_issue_taxonomies(link)
-                normalized_tag = tag.replace('|', '/').strip() if tag else ""
-                if normalized_tag:
-                    normalized_lower = normalized_tag.lower()
-                    if not any(existing.lower() == normalized_lower for existing in issue_tags):
-                        issue_tags.append(normalized_tag)
-
-                all_issues[issue_id] = {
-                    "Issue ID": issue_id,
-                    "Issue Title": title,
-                    "Description": description, 
-                    "Issue URL": link,
-                    "Project": project_id,
-                    "Status": status,
-                    "Priority": priority,
-                    "Component": component,
-                    "Version": version,
-                    "Created": created,
-                    "wcag_sc": current_wcag,
-                    "Taxonomies": normalize_taxonomy_values(issue_tags)
-                }
-                
-            except Exception as e:
+    # Pages are fetched concurrently (bounded by `workers` and the per-host
+    # rate limiter) but merged strictly in tag order, so the result is the
+    # same as fetching one tag at a time.
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(fetch_tag, tag) for tag in tags_to_search]
+        for tag, future in zip(tags_to_search, futures):
+            response = future.result()
+            if stop.is_set():
+                for pending in futures:
+                    pending.cancel()
+                break
+
+            if response is None or response.status_code != 200:
+                print(f"Failed to fetch tag '{tag}' after retries.")
+                register_error()
                 continue
-        
-        # Be nice to the server
-        time.sleep(1)
+
+            merge_drupal_search_page(all_issues, response.content, tag, project_id, since=cutoff, now=now,
+                                     limit=limit, per_tag_limit=per_tag_limit)
+            if limit and len(all_issues) >= limit:
+                # Enough unique issues: don't issue requests for the remaining tags
+                print(f"Collected {len(all_issues)} issues (limit {limit}); skipping remaining tags.")
+                enough.set()
+                for pending in futures:
+                    pending.cancel()
+                break
 
     print(f"Total unique issues found: {len(all_issues)}")
+    enrich_drupal_taxonomies(all_issues, workers=workers)
     return pd.DataFrame(list(all_issues.values()))
 
-def run(project_id, repo_id, results_dir, tags=None, limit=None):
-    # repo_id is passed from argparse, usually same as project_id or 'drupal'
+def load_baseline(baseline_dir):
+    """Return (baseline DataFrame, high-water mark) from a previous run directory."""
+    if not baseline_dir:
+        return None, None
+    files = sorted(Path(baseline_dir).glob("issues_raw_*.csv"))
+    if not files:
+        print(f"No raw issues in {baseline_dir}; running a full extraction.")
+        return None, None
+    baseline = pd.read_csv(files[-1], dtype={"Issue ID": str})
+    if "Updated" not in baseline.columns:
+        print(f"{files[-1]} has no 'Updated' column; running a full extraction.")
+        return None, None
+    updated = baseline["Updated"][baseline["Updated"].astype(str).str.match(r"\d{4}-")]
+    if updated.empty:
+        return None, None
+    high_water = updated.max()
+    print(f"Incremental baseline: {files[-1]} ({len(baseline)} issues, updated up to {high_water})")
+    return baseline, high_water
+
+
+def merge_snapshot(baseline, delta):
+    """Replace baseline rows by their updated versions and drop issues that were closed."""
+    delta = delta.astype({"Issue ID": str})
+    kept = baseline[~baseline["Issue ID"].astype(str).isin(delta["Issue ID"])]
+    active = delta[delta["Status"].apply(is_active_issue)]
+    return pd.concat([kept, active], ignore_index=True)
+
+
+def run(project_id, repo_id, results_dir, tags=None, limit=None, workers=4, baseline_dir=None, per_tag_limit=50):
+    # repo_id is passed from argparse, usually same as project_id or 'drupal'.
+    # Per-host rates come from ratelimit.configure(), called once by run_acr
+    # before any step, so limiters keep their adaptive state between steps.
+    baseline, since = load_baseline(baseline_dir)
     if repo_id and "/" in repo_id:
-        df = extract_github_issues(repo_id, tags=tags)
+        df = extract_github_issues(repo_id, tags=tags, limit=limit, since=since)
     else:
-        df = extract_drupal_issues(repo_id if repo_id else 'drupal', tags=tags)
+        df = extract_drupal_issues(repo_id if repo_id else 'drupal', tags=tags, limit=limit, workers=workers,
+                                   since=since, per_tag_limit=per_tag_limit)
+
+    timestamp = datetime.now().strftime('%Y%m%d')
+    if baseline is not None:
+        delta_file = results_dir / f"issues_delta_{timestamp}.csv"
+        df.to_csv(delta_file, index=False)
+        print(f"Saved {len(df)} changed issues to {delta_file}")
+        df = merge_snapshot(baseline, df) if not df.empty else baseline
     
-    # Apply limit if specified
-    if limit and not df.empty:
+    # The extractors already stop at `limit`; this also caps a merged incremental snapshot
+    if limit and not df.empty and len(df) > limit:
         print(f"Limiting to first {limit} issues (out of {len(df)} total)")
         df = df.head(limit)
     
+    cache = http_cache.current_cache()
+    if cache:
+        print(f"HTTP cache: {cache.stats()}")
+
     if not df.empty:
-        timestamp = datetime.now().strftime('%Y%m%d')
         outfile = results_dir / f"issues_raw_{timestamp}.csv"
         df.to_csv(outfile, index=False)
         print(f"Saved {len(df)} issues to {outfile}")
@@ -1,6 +1,22 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
 import yaml
 import pandas as pd
-from datetime import datetime
+
+from src import atomic, manifest, wcag
+
+# libyaml's emitter is much faster than the pure-Python one and writes the same YAML
+try:
+    Dumper = yaml.CSafeDumper
+except AttributeError:
+    Dumper = yaml.SafeDumper
+
+INFILE_NAME = "wcag-acr-consolidated.csv"
+OUTFILE_NAME = "openacr-report.yaml"
+STAGE = "yaml"
 
 # Define the complete OpenACR template structure matching the 2.4-edition-wcag-2.1-508-en catalog
 def create_openacr_template():
@@ -78,51 +94,33 @@ def create_openacr_template():
         }
     }
 
+# OpenACR chapter for each conformance level in the WCAG catalog
+LEVEL_CHAPTERS = {
+    "A": "success_criteria_level_a",
+    "AA": "success_criteria_level_aa",
+    "AAA": "success_criteria_level_aaa",
+}
+
 def get_wcag_level(sc):
-    """Map WCAG Success Criterion to conformance level (A, AA, AAA)."""
-    # WCAG 2.1 Level A criteria
-    level_a = [
-        '1.1.1', '1.2.1', '1.2.2', '1.2.3', '1.3.1', '1.3.2', '1.3.3',
-        '1.4.1', '1.4.2', '2.1.1', '2.1.2', '2.1.4', '2.2.1', '2.2.2',
-        '2.3.1', '2.4.1', '2.4.2', '2.4.3', '2.4.4', '2.5.1', '2.5.2',
-        '2.5.3', '2.5.4', '3.1.1', '3.2.1', '3.2.2', '3.3.1', '3.3.2',
-        '4.1.1', '4.1.2'
-    ]
-    
-    # WCAG 2.1 Level AA criteria
-    level_aa = [
-        '1.2.4', '1.2.5', '1.3.4', '1.3.5', '1.4.3', '1.4.4', '1.4.5',
-        '1.4.10', '1.4.11', '1.4.12', '1.4.13', '2.4.5', '2.4.6', '2.4.7',
-        '3.1.2', '3.2.3', '3.2.4', '3.3.3', '3.3.4', '4.1.3'
-    ]
-    
-    # WCAG 2.1 Level AAA criteria
-    level_aaa = [
-        '1.2.6', '1.2.7', '1.2.8', '1.2.9', '1.3.6', '1.4.6', '1.4.7',
-        '1.4.8', '1.4.9', '2.1.3', '2.2.3', '2.2.4', '2.2.5', '2.2.6',
-        '2.3.2', '2.3.3', '2.4.8', '2.4.9', '2.4.10', '2.5.5', '2.5.6',
-        '3.1.3', '3.1.4', '3.1.5', '3.1.6', '3.2.5', '3.3.5', '3.3.6'
-    ]
-    
-    if sc in level_a:
-        return 'success_criteria_level_a'
-    elif sc in level_aa:
-        return 'success_criteria_level_aa'
-    elif sc in level_aaa:
-        return 'success_criteria_level_aaa'
-    else:
-        # Default to Level AA if unknown
-        return 'success_criteria_level_aa'
-
-def run(results_dir):
-    """Generate OpenACR YAML report from consolidated CSV."""
-    infile = results_dir / "wcag-acr-consolidated.csv"
-    if not infile.exists():
-        print("No consolidated report found.")
-        return
+    """Map WCAG Success Criterion to its OpenACR chapter, or None if it is not a WCAG SC."""
+    return LEVEL_CHAPTERS.get(wcag.level(sc))
+
+def template_hash():
+    """Hash of everything besides the consolidated CSV that shapes the report."""
+    levels = {sc: criterion.level for sc, criterion in wcag.CRITERIA.items()}
+    return manifest.text_hash(create_openacr_template(), LEVEL_CHAPTERS, levels)
+
+def up_to_date(results_dir):
+    infile = Path(results_dir) / INFILE_NAME
+    return infile.exists() and manifest.is_current(
+        Path(results_dir), STAGE, manifest.fingerprint(infile, None, template_hash()))
+
+def _text(value):
+    """CSV cell as plain text; empty cells (NaN) become ""."""
+    return "" if pd.isna(value) else str(value)
 
-    df = pd.read_csv(infile)
-    
+def build_report(df):
+    """Build the OpenACR report dict from a consolidated frame."""
     # Create report from template
     report = create_openacr_template()
     today = datetime.now().strftime("%Y-%m-%d")
@@ -130,9 +128,13 @@ def run(results_dir):
     report['last_modified_date'] = today
 
     # Process each issue and populate the appropriate WCAG criteria
+    unknown = []
     for _, row in df.iterrows():
         sc = str(row['WCAG SC']).strip()
         level_key = get_wcag_level(sc)
+        if level_key is None:
+            unknown.append(sc)
+            continue
         
         # Create the criterion object following OpenACR format
         criterion = {
@@ -141,8 +143,8 @@ def run(results_dir):
                 {
                     "name": "web",
                     "adherence": {
-                        "level": row.get('ACR Assessment', ''),  # e.g. "partially-supports", "does-not-support"
-                        "notes": row.get('ACR Summary', '')
+                        "level": _text(row.get('ACR Assessment', '')),  # e.g. "partially-supports", "does-not-support"
+                        "notes": _text(row.get('ACR Summary', ''))
                     }
                 },
                 {
@@ -173,8 +175,72 @@ def run(results_dir):
         if level_key in report['chapters']:
             report['chapters'][level_key]['criteria'].append(criterion)
 
+    if unknown:
+        print(f"⚠️ Left out of the YAML (not WCAG success criteria): {', '.join(unknown)}")
+    return report
+
+def write_yaml(report, path):
+    """Write `report` to `path` atomically, so readers never see a partial file."""
+    with atomic.writer(path) as f:
+        yaml.dump(report, f, Dumper=Dumper, sort_keys=False, default_flow_style=False, allow_unicode=True)
+
+def run(results_dir, force=False):
+    """Generate OpenACR YAML report from consolidated CSV (even if up to date when `force`)."""
+    results_dir = Path(results_dir)
+    infile = results_dir / INFILE_NAME
+    if not infile.exists():
+        print("No consolidated report found.")
+        return None
+
+    yaml_outfile = results_dir / OUTFILE_NAME
+    fp = manifest.fingerprint(infile, None, template_hash())
+    if not force and manifest.is_current(results_dir, STAGE, fp):
+        print(f"✅ {yaml_outfile} is up to date")
+        return yaml_outfile
+
+    report = build_report(pd.read_csv(infile))
+
     # Output only YAML format
-    yaml_outfile = results_dir / "openacr-report.yaml"
-    with open(yaml_outfile, 'w') as f:
-        yaml.dump(report, f, sort_keys=False, default_flow_style=False, allow_unicode=True)
+    write_yaml(report, yaml_outfile)
+    manifest.record(results_dir, STAGE, fp, yaml_outfile)
     print(f"✅ Generated OpenACR YAML: {yaml_outfile}")
+    return yaml_outfile
+
+def find_result_dirs(results_root=Path("results")):
+    """Run directories under `results_root` that have a consolidated CSV (dot folders skipped)."""
+    results_root = Path(results_root)
+    if not results_root.exists():
+        return []
+    return [p for p in sorted(results_root.iterdir())
+            if p.is_dir() and not p.name.startswith('.') and (p / INFILE_NAME).exists()]
+
+def run_batch(results_dirs, workers=None):
+    """
+    Generate the YAML for many run directories, spread over a process pool.
+    Returns the paths written, in the order of `results_dirs`.
+    """
+    results_dirs = [Path(d) for d in results_dirs]
+    if workers == 1 or len(results_dirs) <= 1:
+        return [run(d) for d in results_dirs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run, results_dirs))
+
+def main():
+    parser = argparse.ArgumentParser(description="Regenerate openacr-report.yaml from consolidated CSVs")
+    parser.add_argument("dirs", nargs="*", type=Path,
+                        help="Run directories to process (default: every run in results/ with a consolidated CSV)")
+    parser.add_argument("--results-root", type=Path, default=Path("results"),
+                        help="Where to look for run directories when none are given (default: results)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    dirs = args.dirs or find_result_dirs(args.results_root)
+    if not dirs:
+        print("No run directories with a consolidated report found.")
+        return
+    written = [p for p in run_batch(dirs, workers=args.workers) if p]
+    print(f"Generated {len(written)} of {len(dirs)} OpenACR reports")
+
+if __name__ == "__main__":
+    main()
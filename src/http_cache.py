@@ -0,0 +1,156 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+DEFAULT_PATH = Path(".cache") / "http.sqlite"
+DEFAULT_TTL = 12 * 60 * 60  # seconds
+DEFAULT_MAX_MB = 500
+
+# Headers that are meaningless (or harmful) to replay from disk
+_SKIP_HEADERS = {"set-cookie", "content-length", "transfer-encoding", "connection"}
+
+
+class HttpCache:
+    """
+    Persistent URL-keyed response cache stored in a single SQLite file.
+
+    Entries younger than `ttl` seconds are served without touching the
+    network. Older entries are revalidated with If-None-Match /
+    If-Modified-Since; a 304 refreshes the entry in place. Once the stored
+    bodies exceed `max_bytes`, least recently used entries are evicted.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " url TEXT PRIMARY KEY, headers TEXT, body BLOB, etag TEXT,"
+            " last_modified TEXT, stored_at REAL, accessed_at REAL, size INTEGER)"
+        )
+        self._conn.commit()
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def lookup(self, url):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT headers, body, etag, last_modified, stored_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+        headers, body, etag, last_modified, stored_at = row
+        return {
+            "headers": json.loads(headers),
+            "body": body,
+            "etag": etag,
+            "last_modified": last_modified,
+            "stored_at": stored_at,
+        }
+
+    def is_fresh(self, entry):
+        return self.ttl > 0 and time.time() - entry["stored_at"] < self.ttl
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url, response):
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in _SKIP_HEADERS}
+        body = response.content
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            if old:
+                self._total -= old[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, json.dumps(headers), body, response.headers.get("ETag"),
+                 response.headers.get("Last-Modified"), now, now, len(body)),
+            )
+            self._total += len(body)
+            self._evict()
+            self._conn.commit()
+
+    def refresh(self, url, response):
+        """Mark an entry fresh again after a 304 Not Modified."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE responses SET stored_at = ?, etag = COALESCE(?, etag) WHERE url = ?",
+                (time.time(), response.headers.get("ETag"), url),
+            )
+            self._conn.commit()
+
+    def _evict(self):
+        if self._total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT url, size FROM responses ORDER BY accessed_at").fetchall()
+        for url, size in rows:
+            if self._total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self._total -= size
+
+    def stats(self):
+        return f"{self.hits} fresh hits, {self.revalidated} revalidated, {self.misses} downloads"
+
+
+def to_response(entry, url):
+    """Rebuild a requests.Response from a cache entry."""
+    response = requests.Response()
+    response.status_code = 200
+    response._content = entry["body"]
+    response.headers = CaseInsensitiveDict(entry["headers"])
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.url = url
+    response.from_cache = True
+    return response
+
+
+_cache = None
+_settings = {"enabled": True, "path": DEFAULT_PATH, "ttl": DEFAULT_TTL, "max_mb": DEFAULT_MAX_MB}
+_cache_lock = threading.Lock()
+
+
+def configure(enabled=None, path=None, ttl=None, max_mb=None):
+    """Override cache settings; takes effect the next time the cache is opened."""
+    global _cache
+    for key, value in (("enabled", enabled), ("path", path), ("ttl", ttl), ("max_mb", max_mb)):
+        if value is not None:
+            _settings[key] = value
+    _cache = None
+
+
+def get_cache():
+    """Return the shared cache, or None when caching is disabled."""
+    global _cache
+    if not _settings["enabled"]:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = HttpCache(_settings["path"], ttl=_settings["ttl"],
+                               max_bytes=int(_settings["max_mb"] * 1024 * 1024))
+        return _cache
+
+
+def current_cache():
+    """Return the cache if it has been opened during this run, else None."""
+    return _cache
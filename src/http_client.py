@@ -0,0 +1,189 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+from src import http_cache, ratelimit
+
+_local = threading.local()
+
+# Last seen X-RateLimit-* values per (host, resource), e.g. GitHub "core"/"search"
+_quota = {}
+_quota_lock = threading.Lock()
+
+# Longest we are willing to sleep for an exhausted quota window to reset
+MAX_QUOTA_WAIT = 90
+
+# Below this share of the quota window left, requests are spread out until the reset
+QUOTA_LOW_FRACTION = 0.2
+
+
+def get_session():
+    """Return a per-thread requests.Session so workers reuse connections."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _local.session = session
+    return session
+
+
+def host_of(url):
+    return urlparse(url).netloc.lower()
+
+
+def resource_of(url):
+    """Name of the quota bucket a URL is charged to (GitHub keeps search separate)."""
+    path = urlparse(url).path
+    if path.startswith("/search/"):
+        return "search"
+    if path.startswith("/graphql"):
+        return "graphql"
+    return "core"
+
+
+def record_quota(url, response):
+    """Remember the rate-limit budget advertised by the server, if any; returns it."""
+    remaining = response.headers.get("X-RateLimit-Remaining")
+    if remaining is None:
+        return None
+    resource = response.headers.get("X-RateLimit-Resource") or resource_of(url)
+    try:
+        entry = {
+            "remaining": int(remaining),
+            "limit": int(response.headers.get("X-RateLimit-Limit", 0)),
+            "reset": float(response.headers.get("X-RateLimit-Reset", 0)),
+        }
+    except ValueError:
+        return None
+    with _quota_lock:
+        _quota[(host_of(url), resource)] = entry
+    return entry
+
+
+def quota_limiter(url):
+    """
+    Limiter for the quota bucket `url` is charged to, separate from the host's
+    limiter so a low search quota does not slow core API calls. It has no
+    rate of its own; pace_quota() and exhausted windows slow it down.
+    """
+    return ratelimit.limiter_for(f"{host_of(url)}:{resource_of(url)}", rate=0, burst=1, concurrency=0)
+
+
+def pace_quota(limiter, entry):
+    """Slow a quota bucket's limiter when little of its window is left."""
+    if entry and entry["limit"] and entry["remaining"] < entry["limit"] * QUOTA_LOW_FRACTION:
+        limiter.fit_quota(entry["remaining"], entry["reset"] - time.time())
+    else:
+        limiter.fit_quota(None, 0)
+
+
+def quota_status(host):
+    """Return {resource: {"remaining", "limit", "reset"}} last seen for a host."""
+    with _quota_lock:
+        return {resource: dict(entry) for (h, resource), entry in _quota.items() if h == host}
+
+
+def _quota_wait(url):
+    """Seconds until the exhausted quota charged by `url` resets (0 if not exhausted)."""
+    entry = quota_status(host_of(url)).get(resource_of(url))
+    now = time.time()
+    if entry and entry["remaining"] <= 0 and entry["reset"] > now:
+        return entry["reset"] - now
+    return 0
+
+
+def cache_key(url, params=None):
+    return requests.Request("GET", url, params=params).prepare().url
+
+
+def get(url, params=None, headers=None, timeout=30, max_retries=3, backoff=5, on_error=None, use_cache=True):
+    """
+    Rate-limited, cached GET shared by all extract/scrape code.
+
+    Fresh entries in the on-disk cache (see src.http_cache) are returned
+    without a request; stale ones are revalidated with their ETag /
+    Last-Modified (GitHub does not charge 304s against the quota).
+    X-RateLimit-* headers are tracked so an exhausted quota window is waited
+    out when it resets soon, and requests are spread out when the window runs
+    low. A 429/503 (or GitHub's secondary limit) slows the host's adaptive
+    limiter and pauses every worker talking to it, for Retry-After seconds
+    when given, before retrying. `on_error` is called once per failed
+    attempt so callers can keep their own error budget; if it returns True
+    the request is abandoned. Returns the last response received, or None.
+    """
+    cache = http_cache.get_cache() if use_cache else None
+    key = cache_key(url, params)
+    entry = cache.lookup(key) if cache else None
+    if entry and cache.is_fresh(entry):
+        cache.hits += 1
+        return http_cache.to_response(entry, key)
+
+    request_headers = dict(headers or {})
+    if entry:
+        request_headers.update(cache.conditional_headers(entry))
+
+    limiter = ratelimit.limiter_for(host_of(url))
+    quota = quota_limiter(url)
+    response = None
+
+    for attempt in range(max_retries):
+        wait = _quota_wait(url)
+        if 0 < wait <= MAX_QUOTA_WAIT:
+            print(f"Rate limit quota for {host_of(url)} ({resource_of(url)}) exhausted. "
+                  f"Waiting {wait:.0f} seconds for reset...")
+            quota.pause(wait + 1)
+        # Wait on the quota bucket first, so a paced bucket holds no host slot
+        quota.acquire()
+        quota.release()
+        limiter.acquire()
+        try:
+            response = get_session().get(url, params=params, headers=request_headers, timeout=timeout)
+        except requests.RequestException as exc:
+            limiter.release(ok=False)
+            print(f"Error fetching {url} (Attempt {attempt+1}): {exc}")
+            if on_error and on_error():
+                return None
+            time.sleep(1)
+            continue
+
+        pace_quota(quota, record_quota(url, response))
+        retry_after = ratelimit.parse_retry_after(response.headers.get("Retry-After"))
+        status = response.status_code
+        throttled = status in (429, 503) or (status == 403 and (
+            retry_after is not None or response.headers.get("X-RateLimit-Remaining") == "0"))
+        limiter.release(ok=not throttled and status < 500)
+
+        if status == 403 and response.headers.get("X-RateLimit-Remaining") == "0":
+            wait = _quota_wait(url)
+            if 0 < wait <= MAX_QUOTA_WAIT and attempt + 1 < max_retries:
+                continue
+            return response
+
+        if throttled:
+            # 429, 503 and GitHub's secondary limit (403 + Retry-After)
+            wait = retry_after if retry_after is not None else backoff * (attempt + 1)
+            print(f"Throttled ({status}) by {host_of(url)}. Slowing down and pausing requests for {wait:.0f} seconds...")
+            limiter.backoff(wait)
+            if on_error and on_error():
+                return response
+            continue
+
+        if status >= 500:
+            print(f"Server error {status} fetching {url} (Attempt {attempt+1})")
+            if on_error and on_error():
+                return response
+            time.sleep(1)
+            continue
+
+        if cache:
+            if response.status_code == 304 and entry:
+                cache.refresh(key, response)
+                cache.revalidated += 1
+                return http_cache.to_response(entry, key)
+            if response.status_code == 200:
+                cache.store(key, response)
+                cache.misses += 1
+        return response
+
+    return response
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_PATH = Path(".cache") / "llm.sqlite"
+DEFAULT_MAX_MB = 200
+
+
+class LLMCache:
+    """
+    Persistent cache of model responses stored in a single SQLite file.
+
+    Entries are keyed by a hash of (backend, model, system prompt, prompt,
+    generation options, streaming stop fields), so any change to the prompt
+    text or options is a miss, and a response cut short at some fields is
+    never served to a caller that wants others. Once the stored responses exceed `max_bytes`, least recently used
+    entries are evicted.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, backend TEXT, model TEXT, response TEXT,"
+            " stored_at REAL, accessed_at REAL, size INTEGER)"
+        )
+        self._conn.commit()
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(backend, model, prompt, options=None, system=None, stream=False, stop_fields=None):
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        parts = [backend, model, prompt_hash, options or {}]
+        if system:
+            parts.append(hashlib.sha256(system.encode("utf-8")).hexdigest())
+        if stream:
+            # Streamed calls may stop once `stop_fields` are complete
+            parts.append({"stream": True, "stop_fields": stop_fields})
+        payload = json.dumps(parts, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return row[0]
+
+    def put(self, key, backend, model, response):
+        size = len(response.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if old:
+                self._total -= old[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, backend, model, response, now, now, size),
+            )
+            self._total += size
+            self._evict()
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if old is None:
+                return
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._total -= old[0]
+            self._conn.commit()
+
+    def _evict(self):
+        if self._total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+        for key, size in rows:
+            if self._total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._total -= size
+
+    def stats(self):
+        total = self.hits + self.misses
+        rate = f" ({100 * self.hits / total:.0f}% hit rate)" if total else ""
+        return f"{self.hits} hits, {self.misses} misses{rate}"
+
+
+_cache = None
+_settings = {"enabled": True, "path": DEFAULT_PATH, "max_mb": DEFAULT_MAX_MB}
+_cache_lock = threading.Lock()
+
+
+def configure(enabled=None, path=None, max_mb=None):
+    """Override cache settings; takes effect the next time the cache is opened."""
+    global _cache
+    for key, value in (("enabled", enabled), ("path", path), ("max_mb", max_mb)):
+        if value is not None:
+            _settings[key] = value
+    _cache = None
+
+
+def get_cache():
+    """Return the shared cache, or None when caching is disabled."""
+    global _cache
+    if not _settings["enabled"]:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache(_settings["path"], max_bytes=int(_settings["max_mb"] * 1024 * 1024))
+        return _cache
+
+
+def current_cache():
+    """Return the cache if it has been opened during this run, else None."""
+    return _cache
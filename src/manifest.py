@@ -0,0 +1,94 @@
+import hashlib
+import json
+import threading
+from datetime import datetime
+
+from src import atomic
+
+MANIFEST_NAME = "manifest.json"
+
+_lock = threading.Lock()
+
+
+def file_hash(path):
+    """sha256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_hash(*parts):
+    """sha256 of any JSON-serializable values (prompt templates, settings, row fields)."""
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def model_id(ai_config):
+    return f"{ai_config.get('backend', 'gemini')}:{ai_config.get('model_name') or 'default'}"
+
+
+def settings(ai_config, **extra):
+    """
+    Generation settings worth recording next to a stage's fingerprint, so a
+    later rerun (scripts/regenerate_acrs.py) can reproduce them.
+    """
+    recorded = {"max_tokens": ai_config.get("max_tokens"), "timeout": ai_config.get("timeout"),
+                "stream": bool(ai_config.get("stream"))}
+    recorded.update(extra)
+    return recorded
+
+
+def fingerprint(input_path, model, prompt_hash, **params):
+    """
+    What a stage's output depends on: the input file's contents (plus any
+    `params` such as --limit), the model and the prompt templates.
+    """
+    return {
+        "input": input_path.name,
+        "input_hash": text_hash(file_hash(input_path), params),
+        "model": model,
+        "prompt_hash": prompt_hash,
+    }
+
+
+def load(results_dir):
+    path = results_dir / MANIFEST_NAME
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (ValueError, OSError) as e:
+        print(f"Ignoring unreadable {path} ({e})")
+        return {}
+
+
+def entry(results_dir, stage):
+    return load(results_dir).get(stage) or {}
+
+
+def is_current(results_dir, stage, fp):
+    """True if `stage` last ran with fingerprint `fp` and its output is untouched since."""
+    recorded = entry(results_dir, stage)
+    if not recorded or any(recorded.get(key) != value for key, value in fp.items()):
+        return False
+    output = results_dir / recorded.get("output", "")
+    return output.is_file() and file_hash(output) == recorded.get("output_hash")
+
+
+def record(results_dir, stage, fp, output, items=None, settings=None):
+    """Store the fingerprint and output of a finished stage (plus optional per-item hashes and settings)."""
+    new_entry = dict(fp, output=output.name, output_hash=file_hash(output),
+                     recorded_at=datetime.now().isoformat(timespec="seconds"))
+    if items is not None:
+        new_entry["items"] = items
+    if settings is not None:
+        new_entry["settings"] = settings
+    path = results_dir / MANIFEST_NAME
+    # Stages of one run can finish concurrently (pipeline mode)
+    with _lock:
+        manifest = load(results_dir)
+        manifest[stage] = new_entry
+        with atomic.writer(path) as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
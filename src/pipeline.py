@@ -0,0 +1,90 @@
+import queue
+import threading
+
+import pandas as pd
+
+from src import analyze_thread, consolidate, extract, generate_yaml, summarize, thread_compact
+
+
+def _start(target, *args, **kwargs):
+    """Run `target` on a thread, keeping any exception for the caller to re-raise."""
+    outcome = {}
+
+    def runner():
+        try:
+            target(*args, **kwargs)
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=runner, daemon=True)
+    thread.start()
+    return thread, outcome
+
+
+def run(repo_id, results_dir, ai_config, tags=None, limit=None, fetch_workers=4,
+        baseline_dir=None, per_tag_limit=50, token_budget=thread_compact.DEFAULT_TOKEN_BUDGET, extract_issues=True,
+        consolidate_token_budget=consolidate.DEFAULT_TOKEN_BUDGET):
+    """
+    Run steps 1-5 as a streaming pipeline instead of one after another.
+
+    Extraction runs first: the tag searches have to be merged and
+    de-duplicated before a row is final. After that, each summarized row is
+    handed to thread analysis through a bounded queue, so thread fetching
+    and analysis overlap with summarization. Consolidation (and the YAML)
+    only needs the summaries, so it starts as soon as the last one is saved
+    and runs while thread analysis finishes. Output files are the same as a
+    step-by-step run.
+    """
+    if extract_issues:
+        print("\n--- Pipeline: extracting issues ---")
+        extract.run('drupal', repo_id, results_dir, tags=tags, limit=limit, workers=fetch_workers,
+                    baseline_dir=baseline_dir, per_tag_limit=per_tag_limit)
+
+    files = sorted(results_dir.glob("issues_raw_*.csv"))
+    if not files:
+        print("No raw issues found; nothing to pipeline.")
+        return
+
+    # Same frame (and row labels) summarize.run works on
+    df = pd.read_csv(files[-1])
+    if limit:
+        df = df.head(limit)
+    for col in summarize.OUTPUT_COLUMNS:
+        if col not in df.columns:
+            df[col] = ""
+        df[col] = df[col].astype(object)
+
+    workers = max(1, ai_config.get('workers') or 1)
+    summarized = queue.Queue(maxsize=4 * workers)
+
+    def summarize_stage():
+        try:
+            summarize.run(results_dir, ai_config, limit=limit, emit=lambda idx, row: summarized.put((idx, row)))
+        finally:
+            summarized.put(None)
+
+    def report_stage():
+        summary_thread.join()
+        if summary_outcome.get('error'):
+            return
+        print("\n--- Pipeline: summaries complete, consolidating while threads are analyzed ---")
+        consolidate.run(results_dir, ai_config, token_budget=consolidate_token_budget)
+        generate_yaml.run(results_dir)
+
+    print("\n--- Pipeline: summarizing and analyzing threads ---")
+    summary_thread, summary_outcome = _start(summarize_stage)
+    report_thread, report_outcome = _start(report_stage)
+    thread_thread, thread_outcome = _start(
+        analyze_thread.run, results_dir, ai_config, limit=limit, fetch_workers=fetch_workers,
+        token_budget=token_budget, df=df, incoming=summarized)
+
+    thread_thread.join()
+    if thread_outcome.get('error'):
+        # Nothing consumes the summaries any more; keep the queue draining so
+        # summarize is not left blocked on it.
+        threading.Thread(target=lambda: list(iter(summarized.get, None)), daemon=True).start()
+    for thread in (summary_thread, report_thread):
+        thread.join()
+    for outcome in (summary_outcome, thread_outcome, report_outcome):
+        if outcome.get('error'):
+            raise outcome['error']
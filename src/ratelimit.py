@@ -0,0 +1,174 @@
+import email.utils
+import threading
+import time
+
+
+# Multiplicative decrease applied on every throttling signal
+DECREASE = 0.5
+# Never slow below this fraction of the configured rate
+MIN_RATE_FRACTION = 0.05
+
+
+class RateLimiter:
+    """
+    Adaptive token-bucket limiter shared by every worker talking to one service.
+
+    `rate` (requests/second, 0 = unlimited) and `concurrency` (in-flight
+    requests, 0 = unlimited) are ceilings. Each throttling signal (429, 503,
+    quota error) halves the current rate and concurrency window and pauses
+    all workers, for Retry-After seconds when the server gave it. Each
+    success grows them back additively (AIMD), so a run settles at whatever
+    the service currently allows.
+    """
+
+    def __init__(self, rate=1.0, burst=1, concurrency=0):
+        self.max_rate = float(rate)
+        self.rate = self.max_rate
+        self.burst = max(1, int(burst))
+        self.max_concurrency = max(0, int(concurrency or 0))
+        self.window = float(self.max_concurrency)
+        self.in_flight = 0
+        self.throttled = 0
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._quota_rate = None
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+
+    def _effective_rate(self):
+        if self._quota_rate is not None:
+            return min(self.rate, self._quota_rate) if self.rate > 0 else self._quota_rate
+        return self.rate
+
+    def acquire(self):
+        """Block until a request may be sent, honoring any shared backoff; pair with release()."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                rate = self._effective_rate()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self.max_concurrency and self.in_flight >= max(1, int(self.window)):
+                    self._slot_freed.wait(timeout=1.0)
+                    continue
+                elif rate <= 0:
+                    self.in_flight += 1
+                    return
+                else:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self.in_flight += 1
+                        return
+                    wait = (1 - self._tokens) / rate
+            time.sleep(wait)
+
+    def release(self, ok=True):
+        """Return an in-flight slot; a successful request grows rate and window additively."""
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            if ok:
+                if self.max_concurrency:
+                    self.window = min(self.max_concurrency, self.window + 1.0 / max(1.0, self.window))
+                if self.max_rate > 0:
+                    self.rate = min(self.max_rate, self.rate + self.max_rate * MIN_RATE_FRACTION)
+            self._slot_freed.notify()
+
+    def backoff(self, seconds):
+        """React to a throttling response: shrink rate and window, then pause everyone."""
+        with self._lock:
+            self.throttled += 1
+            if self.max_concurrency:
+                self.window = max(1.0, self.window * DECREASE)
+            if self.max_rate > 0:
+                self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate * DECREASE)
+        self.pause(seconds)
+
+    def fit_quota(self, remaining, reset_in):
+        """Spread the requests left in a quota window evenly over the time until it resets."""
+        with self._lock:
+            if remaining is None or reset_in <= 0:
+                self._quota_rate = None
+            else:
+                self._quota_rate = max(remaining, 1) / reset_in
+
+    def pause(self, seconds):
+        """Hold back all workers (e.g. after a 429) for at least `seconds`."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._updated = time.monotonic()
+
+    def status(self):
+        rate = f"{self.rate:.2f}/s" if self.max_rate > 0 else "unlimited"
+        window = f", concurrency {self.window:.1f}/{self.max_concurrency}" if self.max_concurrency else ""
+        return f"rate {rate}{window}, throttled {self.throttled}x"
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_default_rate = 2.0
+_default_burst = 1
+
+
+def configure(rate=None, burst=None):
+    """Set the per-host request rate/burst used for limiters created from now on."""
+    global _default_rate, _default_burst
+    if rate is not None:
+        _default_rate = float(rate)
+    if burst is not None:
+        _default_burst = max(1, int(burst))
+    with _limiters_lock:
+        _limiters.clear()
+
+
+def limiter_for(key, rate=None, burst=None, concurrency=None):
+    """
+    Return the shared limiter for a host or backend, creating it on first use.
+
+    `rate`/`burst`/`concurrency` only apply when the limiter is created; they
+    default to the values set with configure() (concurrency to the burst).
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            burst = _default_burst if burst is None else burst
+            limiter = RateLimiter(rate=_default_rate if rate is None else rate, burst=burst,
+                                  concurrency=burst if concurrency is None else concurrency)
+            _limiters[key] = limiter
+        return limiter
+
+
+# Requests per second allowed for each LLM backend (0 = unlimited)
+LLM_DEFAULT_RATES = {
+    "gemini": 1.0,
+    "ollama": 0,
+}
+
+
+def llm_limiter(ai_config):
+    """Return the shared limiter for the backend named in `ai_config`."""
+    backend = ai_config.get("backend", "gemini")
+    rate = ai_config.get("rate")
+    if rate is None:
+        rate = LLM_DEFAULT_RATES.get(backend, 1.0)
+    workers = max(1, ai_config.get("workers") or 1)
+    return limiter_for(f"llm:{backend}", rate=rate, burst=workers, concurrency=workers)
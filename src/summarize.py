@@ -1,47 +1,20 @@
+import json
+import re
 import pandas as pd
-import os
-import sys
-import time
-import ollama
-
-# Conditionally import genai only when needed
-try:
-    import google.generativeai as genai
-except ImportError:
-    genai = None
-
-class OllamaModel:
-    def __init__(self, model_name="gemma3:4b"):
-        self.model_name = model_name
-
-    def generate_content(self, prompt):
-        try:
-            response = ollama.chat(model=self.model_name, messages=[
-                {
-                    'role': 'user',
-                    'content': prompt,
-                },
-            ])
-            class Response:
-                text = response['message']['content']
-            return Response()
-        except Exception as e:
-            print(f"Ollama Error: {e}")
-            raise e
+from concurrent.futures import ThreadPoolExecutor
 
-def analyze_issue(row, model):
-    prompt = f"""
-You are an experienced web accessibility professional reviewing an issue queue.
-Your role is to identify and clearly describe accessibility barriers, assess whether
-the reported issue is valid and actionable, and provide practical guidance to move
-the issue toward resolution.
+from src import ai_handler, llm_cache, manifest, wcag
 
-Analyze the following accessibility issue:
+# Response lines analyze_issue reads; with streaming enabled generation stops once all are in
+SUMMARY_FIELDS = (
+    ("WCAG_ASSESSMENT:", "WCAG:"),
+    "ACR_NOTE:",
+    ("DEVELOPER_NOTE:", "DEV_NOTE:"),
+    "PROBLEM_SENTENCE:",
+    "SOLUTION_SENTENCE:",
+)
 
-Title: {row['Issue Title']}
-Description: {row['Description']}
-
-Your goal is to:
+ISSUE_GUIDANCE = """Your goal is to:
 - Clarify the actual accessibility barrier, if one exists
 - Nudge the issue forward with concrete, standards-based guidance
 - Provide developers with clear, minimal, and current technical direction
@@ -97,7 +70,20 @@ Implementation priority order:
 3. CSS architecture and layering
 4. Responsive layouts using relative units
 5. Progressive enhancement with JavaScript
-6. Accessibility testing and validation
+6. Accessibility testing and validation"""
+
+_ROLE = """You are an experienced web accessibility professional reviewing an issue queue.
+Your role is to identify and clearly describe accessibility barriers, assess whether
+the reported issue is valid and actionable, and provide practical guidance to move
+the issue toward resolution."""
+
+# Constant instructions are sent as the system prompt so the backend can
+# reuse their evaluation across issues; only the issue text varies.
+SUMMARY_SYSTEM_PROMPT = f"""{_ROLE}
+
+You will be given one accessibility issue (title and description) to analyze.
+
+{ISSUE_GUIDANCE}
 
 Format the response exactly as follows:
 
@@ -107,9 +93,43 @@ ACR_NOTE: ...
 DEVELOPER_NOTE: ...
 TITLE_ASSESSMENT: ...
 WCAG_ASSESSMENT: ...
-    """
+"""
+
+BATCH_SYSTEM_PROMPT = f"""{_ROLE}
+
+You will be given several accessibility issues, each with an ISSUE ID, title and
+description. Analyze each issue independently.
+
+{ISSUE_GUIDANCE}
+
+Respond with a single JSON object and nothing else. Use each ISSUE ID as a key.
+Each value must be an object with these string fields:
+
+{{"problem_sentence": "...", "solution_sentence": "...", "acr_note": "...",
+ "developer_note": "...", "title_assessment": "OK or SUGGEST", "wcag_assessment": "1.1.1"}}
+"""
+
+# JSON keys expected for every issue in a batched response
+BATCH_FIELDS = ("wcag_assessment", "acr_note", "developer_note", "problem_sentence", "solution_sentence")
+
+ISSUE_PROMPT = """Analyze the following accessibility issue:
+
+Title: {title}
+Description: {description}
+"""
+
+BATCH_ITEM = "ISSUE ID: {issue_id}\nTitle: {title}\nDescription: {description}"
+
+BATCH_PROMPT = """Analyze each of the following {count} accessibility issues:
+
+{issues}
+"""
+
+def analyze_issue(row, model):
+    prompt = ISSUE_PROMPT.format(title=row['Issue Title'], description=row['Description'])
     try:
-        resp = model.generate_content(prompt)
+        resp = model.generate_content(prompt, stage="summarize", stop_fields=SUMMARY_FIELDS,
+                                      system=SUMMARY_SYSTEM_PROMPT)
         text = resp.text
         
         wcag = "Unknown"
@@ -128,30 +148,112 @@ WCAG_ASSESSMENT: ...
             elif line.startswith("DEV_NOTE:"): dev_note = line.replace("DEV_NOTE:", "").strip()
             elif line.startswith("PROBLEM_SENTENCE:"): problem_sentence = line.replace("PROBLEM_SENTENCE:", "").strip()
             elif line.startswith("SOLUTION_SENTENCE:"): solution_sentence = line.replace("SOLUTION_SENTENCE:", "").strip()
+
+        if wcag == "Unknown" and not any([acr_note, dev_note, problem_sentence, solution_sentence]):
+            # Nothing parsed: let the next run ask the model again
+            model.discard(resp)
             
         return wcag, acr_note, dev_note, problem_sentence, solution_sentence
+    except ai_handler.QuotaExhausted:
+        # Rate limits are waited out by the handler; this means they never lifted
+        raise
     except Exception as e:
         error_str = str(e)
-        # Check for critical quota/rate limit errors
-        if "429" in error_str or "quota" in error_str.lower():
-            print(f"\nCRITICAL ERROR: API Quota Exceeded or Rate Limit Hit.")
-            print(f"Details: {error_str.splitlines()[0]}")
-            print("Exiting gracefully to prevent further errors.")
-            sys.exit(1)
-
         # Clean up verbose error messages (especially from Gemini)
         error_msg = error_str.split('\n')[0]
         if len(error_msg) > 200: error_msg = error_msg[:200] + "..."
         print(f"Error analyzing issue: {error_msg}")
         return "Error", "Error", "Error", "Error", "Error"
 
-def run(results_dir, ai_config, limit=None):
+def analyze_issue_batch(rows, model):
+    """
+    Summarize several issues with one prompt.
+
+    Returns {Issue ID: (wcag, acr_note, dev_note, problem, solution)} for the
+    issues whose entry in the JSON response is complete; callers fall back
+    to analyze_issue for the rest.
+    """
+    issues_text = "\n---\n".join(
+        BATCH_ITEM.format(issue_id=row['Issue ID'], title=row['Issue Title'], description=row['Description'])
+        for row in rows
+    )
+    prompt = BATCH_PROMPT.format(count=len(rows), issues=issues_text)
+    try:
+        resp = model.generate_content(prompt, system=BATCH_SYSTEM_PROMPT)
+        text = resp.text
+    except ai_handler.QuotaExhausted:
+        raise
+    except Exception as e:
+        error_msg = str(e).split('\n')[0][:200]
+        print(f"Error analyzing batch of {len(rows)} issues: {error_msg}")
+        return {}
+
+    results = {}
+    for issue_id, entry in parse_batch_response(text).items():
+        if not isinstance(entry, dict) or not all(isinstance(entry.get(f), str) for f in BATCH_FIELDS):
+            continue
+        results[issue_id] = (
+            entry["wcag_assessment"].strip() or "Unknown",
+            entry["acr_note"].strip(),
+            entry["developer_note"].strip(),
+            entry["problem_sentence"].strip(),
+            entry["solution_sentence"].strip(),
+        )
+    if not results:
+        model.discard(resp)
+    return results
+
+def parse_batch_response(text):
+    """Extract the JSON object from a model response (tolerates ```json fences and chatter)."""
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        return {}
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {str(k).strip().lstrip('#'): v for k, v in data.items()}
+
+# Columns this step adds to the raw issues
+OUTPUT_COLUMNS = ['ai_wcag', 'acr_note', 'dev_note', 'problem_sentence', 'solution_sentence']
+
+# Manifest entry for this step, and the per-row hash of what each summary was made from
+STAGE = "summarize"
+HASH_COLUMN = "summary_hash"
+
+def prompt_hash(ai_config):
+    """Hash of the prompt templates (and generation cap) this step would use with `ai_config`."""
+    templates = [SUMMARY_SYSTEM_PROMPT, ISSUE_PROMPT]
+    if max(1, ai_config.get('summary_batch') or 1) > 1:
+        templates += [BATCH_SYSTEM_PROMPT, BATCH_PROMPT, BATCH_ITEM]
+    return manifest.text_hash(templates, (ai_config.get('max_tokens') or {}).get('summarize'))
+
+def row_hash(row, fp):
+    return manifest.text_hash(fp["model"], fp["prompt_hash"], row.get('Issue Title'),
+                              row.get('Description'), row.get('wcag_sc'))
+
+def run(results_dir, ai_config, limit=None, emit=None):
+    """
+    Summarize every raw issue, appending rows to the summary CSV in input order.
+
+    `emit(idx, row)` is called for each summarized row (including ones
+    resumed from a previous run) as soon as it is saved; pipeline mode uses
+    it to hand rows to thread analysis.
+    """
     files = sorted(results_dir.glob("issues_raw_*.csv"))
     if not files:
         print("No raw issues found to summarize.")
         return
     
     infile = files[-1]
+    fp = manifest.fingerprint(infile, manifest.model_id(ai_config), prompt_hash(ai_config), limit=limit)
+    if emit is None and manifest.is_current(results_dir, STAGE, fp):
+        print(f"✅ Raw issues, model and prompt unchanged since {manifest.entry(results_dir, STAGE)['output']} "
+              f"was written; nothing to summarize")
+        return
+
     print(f"Reading from {infile}")
     df = pd.read_csv(infile)
     
@@ -161,31 +263,12 @@ def run(results_dir, ai_config, limit=None):
         df = df.head(limit)
     
     # Ensure output columns exist
-    for col in ['ai_wcag', 'acr_note', 'dev_note', 'problem_sentence', 'solution_sentence']:
+    for col in OUTPUT_COLUMNS:
         if col not in df.columns:
             df[col] = ""
+    df[HASH_COLUMN] = [row_hash(row, fp) for _, row in df.iterrows()]
     
-    backend = ai_config.get('backend', 'gemini')
-    model_name = ai_config.get('model_name')
-    
-    if backend == 'ollama':
-        # Default to gemma3:4b if not specified
-        target_model = model_name if model_name else "gemma3:4b"
-        print(f"Using Ollama backend with model: {target_model}")
-        model = OllamaModel(model_name=target_model)
-    else:
-        print("Using Gemini backend")
-        if genai is None:
-            print("ERROR: google-generativeai is not installed. Please install it with 'pip install google-generativeai' to use the Gemini backend.")
-            sys.exit(1)
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        # Ensure model name has models/ prefix
-        if model_name:
-            target_model = model_name if model_name.startswith('models/') else f'models/{model_name}'
-        else:
-            target_model = 'models/gemini-2.0-flash'
-        print(f"Using Gemini model: {target_model}")
-        model = genai.GenerativeModel(target_model)
+    model = ai_handler.get_handler(ai_config)
     
     # Determine output file and check for existing progress
     timestamp = pd.Timestamp.now().strftime('%Y%m%d')
@@ -194,6 +277,7 @@ def run(results_dir, ai_config, limit=None):
     # Check if there is an existing summary file to resume from
     existing_summaries = sorted(results_dir.glob("issues_summarized_*.csv"))
     processed_ids = set()
+    stale_count = 0
     
     if existing_summaries:
         # Use the latest one
@@ -202,47 +286,123 @@ def run(results_dir, ai_config, limit=None):
         try:
             existing_df = pd.read_csv(outfile)
             if 'Issue ID' in existing_df.columns:
+                # A summary is stale when its issue text, the model or the prompt
+                # changed since it was written. Rows from before summary hashes
+                # were recorded (no hash) are kept as they are.
+                expected = dict(zip(df['Issue ID'].astype(str), df[HASH_COLUMN]))
+                missing_hashes = HASH_COLUMN not in existing_df.columns
+                if missing_hashes:
+                    existing_df[HASH_COLUMN] = None
+                recorded = existing_df[HASH_COLUMN]
+                wanted = existing_df['Issue ID'].astype(str).map(expected)
+                stale = recorded.notna() & wanted.notna() & (recorded != wanted)
+                stale_count = int(stale.sum())
+                if stale_count or missing_hashes:
+                    if stale_count:
+                        print(f"{stale_count} issues changed (or were summarized with another model or prompt); "
+                              f"summarizing them again")
+                    existing_df = existing_df[~stale]
+                    existing_df.to_csv(outfile, index=False)
                 processed_ids = set(existing_df['Issue ID'].astype(str))
+                if emit:
+                    done = {str(r['Issue ID']): r for _, r in existing_df.iterrows()}
+                    for idx, row in df.iterrows():
+                        if str(row['Issue ID']) in done:
+                            emit(idx, done[str(row['Issue ID'])])
             print(f"Resuming... {len(processed_ids)} issues already processed.")
         except Exception as e:
             print(f"Error reading existing summary: {e}. Starting fresh.")
     
-    print(f"Summarizing {len(df)} issues...")
-    
-    for idx, row in df.iterrows():
-        if str(row['Issue ID']) in processed_ids:
-            continue
+    workers = max(1, ai_config.get('workers') or 1)
 
+    pending = [(idx, row) for idx, row in df.iterrows() if str(row['Issue ID']) not in processed_ids]
+    print(f"Summarizing {len(df)} issues ({len(pending)} remaining, {workers} worker{'s' if workers > 1 else ''})...")
+
+    def issue_label(idx, row):
         # Extract issue number from URL
         issue_url = row.get('Issue URL', '')
         issue_num = ''
         if '/issues/' in issue_url:
             issue_num = issue_url.split('/issues/')[-1].split('/')[0].split('#')[0]
             issue_num = f"#{issue_num} "
-        
-        print(f"Processing {issue_num}{idx+1}/{len(df)}: {row['Issue Title'][:30]}...")
-        wcag, acr, dev, problem, solution = analyze_issue(row, model)
-        
+        return f"{issue_num}{idx+1}/{len(df)}: {row['Issue Title'][:30]}..."
+
+    def fill_row(row, result):
+        ai_sc, acr, dev, problem, solution = result
+
         # Prefer AI wcag detection if raw was unknown
-        final_wcag = wcag if row['wcag_sc'] == "Unknown" else row['wcag_sc']
-        
-        # Update the row data
-        row['ai_wcag'] = final_wcag
+        final_wcag = ai_sc if row['wcag_sc'] == "Unknown" else row['wcag_sc']
+
+        # Update the row data; "1.4.3 Contrast (Minimum)" is stored as "1.4.3"
+        row['ai_wcag'] = wcag.find_sc(final_wcag) or final_wcag
         row['acr_note'] = acr
         row['dev_note'] = dev
         row['problem_sentence'] = problem
         row['solution_sentence'] = solution
-        
-        # Save incrementally
-        # Create a DataFrame for this single row
-        single_df = pd.DataFrame([row])
-        
-        # Append to CSV
-        # If file doesn't exist, write header. If it does, skip header.
-        header = not outfile.exists()
-        single_df.to_csv(outfile, mode='a', header=header, index=False)
-        
-        if backend == 'gemini':
-            time.sleep(1) # Rate limit for Gemini
-            
+        return row
+
+    def summarize_row(idx, row):
+        print(f"Processing {issue_label(idx, row)}")
+        return [fill_row(row, analyze_issue(row, model))]
+
+    def summarize_batch(batch):
+        if len(batch) == 1:
+            return summarize_row(*batch[0])
+        for idx, row in batch:
+            print(f"Processing {issue_label(idx, row)} (batched)")
+        results = analyze_issue_batch([row for _, row in batch], model)
+        rows = []
+        for idx, row in batch:
+            result = results.get(str(row['Issue ID']))
+            if result is None:
+                print(f"Batch response missing {issue_label(idx, row)}; retrying on its own")
+                result = analyze_issue(row, model)
+            rows.append(fill_row(row, result))
+        return rows
+
+    batch_size = max(1, ai_config.get('summary_batch') or 1)
+    if batch_size > 1:
+        print(f"Packing up to {batch_size} issues into each prompt")
+
+    # Rows are analyzed concurrently but appended in input order, so the
+    # output file (and resume via processed_ids) matches a serial run.
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        if batch_size > 1:
+            futures = [pool.submit(summarize_batch, pending[i:i + batch_size])
+                       for i in range(0, len(pending), batch_size)]
+        else:
+            futures = [pool.submit(summarize_row, idx, row) for idx, row in pending]
+        for future in futures:
+            try:
+                rows = future.result()
+            except ai_handler.QuotaExhausted:
+                for pending_future in futures:
+                    pending_future.cancel()
+                print(f"Rate limits did not lift; summaries so far are saved in {outfile}. Re-run step 2 to resume.")
+                raise
+            for row in rows:
+                # Save incrementally
+                # Create a DataFrame for this single row
+                single_df = pd.DataFrame([row])
+
+                # Append to CSV
+                # If file doesn't exist, write header. If it does, skip header.
+                header = not outfile.exists()
+                single_df.to_csv(outfile, mode='a', header=header, index=False)
+                if emit:
+                    emit(row.name, row)
+
+    if stale_count:
+        # Re-summarized rows were appended at the end; restore input order
+        out_df = pd.read_csv(outfile)
+        order = {issue_id: i for i, issue_id in enumerate(df['Issue ID'].astype(str))}
+        position = out_df['Issue ID'].astype(str).map(order).fillna(len(order))
+        out_df.iloc[position.argsort(kind='stable')].to_csv(outfile, index=False)
+    if outfile.exists():
+        manifest.record(results_dir, STAGE, fp, outfile, settings=manifest.settings(ai_config))
+
     print(f"Saved summaries to {outfile}")
+    print(f"LLM metrics: {model.metrics.summary()}")
+    cache = llm_cache.current_cache()
+    if cache:
+        print(f"LLM cache: {cache.stats()}")
\ No newline at end of file
@@ -0,0 +1,172 @@
+import re
+
+DEFAULT_TOKEN_BUDGET = 3000
+KEEP_FIRST = 3
+KEEP_LAST = 5
+
+# Rough chars-per-token for English prose; good enough to bound prompt size
+CHARS_PER_TOKEN = 4
+
+BOT_AUTHORS = re.compile(r"(\[bot\]$|[-_ ]bot$|^system message$|^codecov|^github-actions|^drupalci)", re.IGNORECASE)
+
+# Short comments that only move the issue status around or ask for updates
+CHATTER = re.compile(
+    r"^(\+1|same here|bump|any (update|news|progress)|thanks!?|"
+    r"(setting|set|moving|back) (to|status)|status:|needs (review|work|tests|testing)|"
+    r"rtbc|reviewed & tested|rerolled?|rebased?|queued|"
+    r"the (last|latest) submitted patch)",
+    re.IGNORECASE,
+)
+CHATTER_MAX_CHARS = 120
+
+# Sentences worth keeping when the middle of a thread is folded
+SIGNAL_WORDS = ("patch", "merge request", "pull request", "mr ", "test", "fail", "screen reader",
+                "nvda", "jaws", "voiceover", "wcag", "aria", "keyboard", "focus", "contrast",
+                "committed", "merged", "fixed", "regression", "reproduce", "workaround")
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def format_comment(c, limit=300):
+    """One prompt line for a comment: number, author, links and trimmed text."""
+    return (
+        f"#{c['number']} by {c['author']}"
+        + (f" ({c.get('profile_link')})" if c.get('profile_link') else "")
+        + (f" [anchor]({c.get('comment_anchor')})" if c.get('comment_anchor') else "")
+        + f": {c['content'][:limit]}"
+    )
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _is_chatter(c):
+    content = c['content'].strip()
+    return len(content) <= CHATTER_MAX_CHARS and bool(CHATTER.match(content))
+
+
+def clean_comments(comments):
+    """
+    Drop bot and duplicate comments and collapse runs of status chatter into
+    a single entry. Returns (comments, stats).
+    """
+    stats = {"bots": 0, "duplicates": 0, "chatter": 0}
+    seen = set()
+    cleaned = []
+    run = []
+
+    def flush_run():
+        if not run:
+            return
+        if len(run) == 1:
+            cleaned.append(run[0])
+        else:
+            stats["chatter"] += len(run) - 1
+            authors = list(dict.fromkeys(c['author'] for c in run))
+            cleaned.append({
+                'number': f"{run[0]['number']}-{run[-1]['number']}",
+                'author': ", ".join(authors[:5]) + (" and others" if len(authors) > 5 else ""),
+                'content': f"{len(run)} status updates, latest: {run[-1]['content'].strip()[:60]}",
+            })
+        run.clear()
+
+    for c in comments:
+        if BOT_AUTHORS.search(c.get('author') or ""):
+            stats["bots"] += 1
+            continue
+        key = _normalize(c['content'])
+        if key and key in seen and not _is_chatter(c):
+            stats["duplicates"] += 1
+            continue
+        seen.add(key)
+        if _is_chatter(c):
+            run.append(c)
+            continue
+        flush_run()
+        cleaned.append(c)
+    flush_run()
+    return cleaned, stats
+
+
+def _key_sentence(c):
+    """First sentence of a comment that mentions something actionable, or None."""
+    for sentence in re.split(r"(?<=[.!?])\s+", c['content']):
+        lower = sentence.lower()
+        if any(word in lower for word in SIGNAL_WORDS):
+            return sentence.strip()[:200]
+    return None
+
+
+def compact_comments(comments, token_budget=DEFAULT_TOKEN_BUDGET, keep_first=KEEP_FIRST, keep_last=KEEP_LAST):
+    """
+    Render the comment thread for the prompt within roughly `token_budget`
+    tokens.
+
+    Bot, duplicate and status-chatter comments are removed first. If the
+    thread still does not fit, the first `keep_first` and last `keep_last`
+    comments are kept verbatim and the middle is folded into one line per
+    comment that mentions patches, tests, assistive tech and the like.
+    If even that is over budget, the oldest kept lines are dropped, never
+    the latest comment. Returns (text, stats) where stats counts what was
+    dropped. A budget of 0 sends every comment unchanged.
+    """
+    if not token_budget:
+        return "\n".join(format_comment(c) for c in comments), {}
+
+    comments, stats = clean_comments(comments)
+    stats["folded"] = 0
+    full = "\n".join(format_comment(c) for c in comments)
+    if estimate_tokens(full) <= token_budget:
+        return full, stats
+
+    head = comments[:keep_first]
+    tail = comments[keep_first:][-keep_last:] if keep_last else []
+    middle = comments[len(head):len(comments) - len(tail)]
+
+    # Shrink the verbatim comments until they leave at least half the budget
+    limit = 300
+    while limit > 80:
+        fixed = [format_comment(c, limit) for c in head + tail]
+        if estimate_tokens("\n".join(fixed)) <= token_budget // 2:
+            break
+        limit -= 40
+    head_lines = [format_comment(c, limit) for c in head]
+    tail_lines = [format_comment(c, limit) for c in tail]
+
+    remaining = token_budget - estimate_tokens("\n".join(head_lines + tail_lines)) - 20
+    # Fill from the most recent end: late activity says more about status
+    summary_lines = []
+    for c in reversed(middle):
+        sentence = _key_sentence(c)
+        if not sentence:
+            continue
+        line = f"#{c['number']} {c['author']}: {sentence}"
+        cost = estimate_tokens(line)
+        if cost > remaining:
+            break
+        summary_lines.insert(0, line)
+        remaining -= cost
+    stats["folded"] = len(middle)
+
+    # Hard cap so prompt size stays bounded whatever the thread looks like.
+    # Over it, drop the oldest kept lines (first comments, then older key
+    # points and tail comments) so the latest comment always survives.
+    cap = token_budget * CHARS_PER_TOKEN
+    stats["dropped"] = 0
+
+    def render():
+        lines = list(head_lines)
+        if middle:
+            lines += [f"[{len(middle)} middle comments condensed to key points:]"] + summary_lines + ["[end of condensed comments]"]
+        return "\n".join(lines + tail_lines)
+
+    text = render()
+    for kept in (head_lines, summary_lines, tail_lines):
+        while len(text) > cap and len(kept) > (1 if kept is tail_lines else 0):
+            kept.pop(0)
+            stats["dropped"] += 1
+            text = render()
+    return text[-cap:], stats
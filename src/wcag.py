@@ -0,0 +1,123 @@
+import re
+from collections import namedtuple
+from types import MappingProxyType
+
+Criterion = namedtuple("Criterion", "level name version")
+
+# WCAG 2.2 success criteria (plus 4.1.1, removed in 2.2 but still in 2.0/2.1
+# reports) with the version that introduced each one
+CRITERIA = MappingProxyType({sc: Criterion(level, name, version) for sc, level, name, version in [
+    ("1.1.1", "A", "Non-text Content", "2.0"),
+    ("1.2.1", "A", "Audio-only and Video-only (Prerecorded)", "2.0"),
+    ("1.2.2", "A", "Captions (Prerecorded)", "2.0"),
+    ("1.2.3", "A", "Audio Description or Media Alternative (Prerecorded)", "2.0"),
+    ("1.2.4", "AA", "Captions (Live)", "2.0"),
+    ("1.2.5", "AA", "Audio Description (Prerecorded)", "2.0"),
+    ("1.2.6", "AAA", "Sign Language (Prerecorded)", "2.0"),
+    ("1.2.7", "AAA", "Extended Audio Description (Prerecorded)", "2.0"),
+    ("1.2.8", "AAA", "Media Alternative (Prerecorded)", "2.0"),
+    ("1.2.9", "AAA", "Audio-only (Live)", "2.0"),
+    ("1.3.1", "A", "Info and Relationships", "2.0"),
+    ("1.3.2", "A", "Meaningful Sequence", "2.0"),
+    ("1.3.3", "A", "Sensory Characteristics", "2.0"),
+    ("1.3.4", "AA", "Orientation", "2.1"),
+    ("1.3.5", "AA", "Identify Input Purpose", "2.1"),
+    ("1.3.6", "AAA", "Identify Purpose", "2.1"),
+    ("1.4.1", "A", "Use of Color", "2.0"),
+    ("1.4.2", "A", "Audio Control", "2.0"),
+    ("1.4.3", "AA", "Contrast (Minimum)", "2.0"),
+    ("1.4.4", "AA", "Resize Text", "2.0"),
+    ("1.4.5", "AA", "Images of Text", "2.0"),
+    ("1.4.6", "AAA", "Contrast (Enhanced)", "2.0"),
+    ("1.4.7", "AAA", "Low or No Background Audio", "2.0"),
+    ("1.4.8", "AAA", "Visual Presentation", "2.0"),
+    ("1.4.9", "AAA", "Images of Text (No Exception)", "2.0"),
+    ("1.4.10", "AA", "Reflow", "2.1"),
+    ("1.4.11", "AA", "Non-text Contrast", "2.1"),
+    ("1.4.12", "AA", "Text Spacing", "2.1"),
+    ("1.4.13", "AA", "Content on Hover or Focus", "2.1"),
+    ("2.1.1", "A", "Keyboard", "2.0"),
+    ("2.1.2", "A", "No Keyboard Trap", "2.0"),
+    ("2.1.3", "AAA", "Keyboard (No Exception)", "2.0"),
+    ("2.1.4", "A", "Character Key Shortcuts", "2.1"),
+    ("2.2.1", "A", "Timing Adjustable", "2.0"),
+    ("2.2.2", "A", "Pause, Stop, Hide", "2.0"),
+    ("2.2.3", "AAA", "No Timing", "2.0"),
+    ("2.2.4", "AAA", "Interruptions", "2.0"),
+    ("2.2.5", "AAA", "Re-authenticating", "2.0"),
+    ("2.2.6", "AAA", "Timeouts", "2.1"),
+    ("2.3.1", "A", "Three Flashes or Below Threshold", "2.0"),
+    ("2.3.2", "AAA", "Three Flashes", "2.0"),
+    ("2.3.3", "AAA", "Animation from Interactions", "2.1"),
+    ("2.4.1", "A", "Bypass Blocks", "2.0"),
+    ("2.4.2", "A", "Page Titled", "2.0"),
+    ("2.4.3", "A", "Focus Order", "2.0"),
+    ("2.4.4", "A", "Link Purpose (In Context)", "2.0"),
+    ("2.4.5", "AA", "Multiple Ways", "2.0"),
+    ("2.4.6", "AA", "Headings and Labels", "2.0"),
+    ("2.4.7", "AA", "Focus Visible", "2.0"),
+    ("2.4.8", "AAA", "Location", "2.0"),
+    ("2.4.9", "AAA", "Link Purpose (Link Only)", "2.0"),
+    ("2.4.10", "AAA", "Section Headings", "2.0"),
+    ("2.4.11", "AA", "Focus Not Obscured (Minimum)", "2.2"),
+    ("2.4.12", "AAA", "Focus Not Obscured (Enhanced)", "2.2"),
+    ("2.4.13", "AAA", "Focus Appearance", "2.2"),
+    ("2.5.1", "A", "Pointer Gestures", "2.1"),
+    ("2.5.2", "A", "Pointer Cancellation", "2.1"),
+    ("2.5.3", "A", "Label in Name", "2.1"),
+    ("2.5.4", "A", "Motion Actuation", "2.1"),
+    ("2.5.5", "AAA", "Target Size (Enhanced)", "2.1"),
+    ("2.5.6", "AAA", "Concurrent Input Mechanisms", "2.1"),
+    ("2.5.7", "AA", "Dragging Movements", "2.2"),
+    ("2.5.8", "AA", "Target Size (Minimum)", "2.2"),
+    ("3.1.1", "A", "Language of Page", "2.0"),
+    ("3.1.2", "AA", "Language of Parts", "2.0"),
+    ("3.1.3", "AAA", "Unusual Words", "2.0"),
+    ("3.1.4", "AAA", "Abbreviations", "2.0"),
+    ("3.1.5", "AAA", "Reading Level", "2.0"),
+    ("3.1.6", "AAA", "Pronunciation", "2.0"),
+    ("3.2.1", "A", "On Focus", "2.0"),
+    ("3.2.2", "A", "On Input", "2.0"),
+    ("3.2.3", "AA", "Consistent Navigation", "2.0"),
+    ("3.2.4", "AA", "Consistent Identification", "2.0"),
+    ("3.2.5", "AAA", "Change on Request", "2.0"),
+    ("3.2.6", "A", "Consistent Help", "2.2"),
+    ("3.3.1", "A", "Error Identification", "2.0"),
+    ("3.3.2", "A", "Labels or Instructions", "2.0"),
+    ("3.3.3", "AA", "Error Suggestion", "2.0"),
+    ("3.3.4", "AA", "Error Prevention (Legal, Financial, Data)", "2.0"),
+    ("3.3.5", "AAA", "Help", "2.0"),
+    ("3.3.6", "AAA", "Error Prevention (All)", "2.0"),
+    ("3.3.7", "A", "Redundant Entry", "2.2"),
+    ("3.3.8", "AA", "Accessible Authentication (Minimum)", "2.2"),
+    ("3.3.9", "AAA", "Accessible Authentication (Enhanced)", "2.2"),
+    ("4.1.1", "A", "Parsing", "2.0"),
+    ("4.1.2", "A", "Name, Role, Value", "2.0"),
+    ("4.1.3", "AA", "Status Messages", "2.1"),
+]})
+
+# Drupal.org issue tags ("wcag111", "wcag1410") in catalog order
+TAGS = MappingProxyType({"wcag" + sc.replace(".", ""): sc for sc in CRITERIA})
+
+# Regex alternation of every catalog SC, longest first so "1.4.10" wins over "1.4.1"
+SC_PATTERN = "|".join(re.escape(sc) for sc in sorted(CRITERIA, key=len, reverse=True))
+
+# A catalog SC standing on its own (not part of "10.3.1" or "1.4.3.2")
+_SC_MENTION = re.compile(r"(?<![\w.])(" + SC_PATTERN + r")(?![\w]|\.\d)")
+
+
+def level(sc):
+    """Conformance level ("A", "AA", "AAA") of `sc`, or None if it is not in the catalog."""
+    criterion = CRITERIA.get(sc)
+    return criterion.level if criterion else None
+
+
+def from_tag(tag):
+    """Map a Drupal issue tag such as "wcag1410" to its SC, or None."""
+    return TAGS.get(tag)
+
+
+def find_sc(text):
+    """First catalog SC mentioned in free text (e.g. "1.4.3 Contrast"), or None."""
+    match = _SC_MENTION.search(str(text))
+    return match.group(1) if match else None